@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
 import sys
 import subprocess
@@ -21,7 +22,7 @@ except ImportError:
         ]
 
 class BatchProcessor:
-    def __init__(self):
+    def __init__(self, metrics_port=None):
         self.source_dir = "source"
         self.input_dir = "videos_input"
         self.output_dir = "videos_output"
@@ -29,11 +30,13 @@ class BatchProcessor:
         self.default_args = [
             "--execution-provider", "cuda",
             "--max-memory", "12",
-            "--execution-threads", "30",
+            "--autotune",
             "--temp-frame-quality", "100",
             "--keep-frames",
             "--keep-fps"
         ]
+        if metrics_port:
+            self.default_args += ["--metrics-port", str(metrics_port)]
     
     def find_source_image(self):
         """Busca la imagen fuente en la carpeta source"""
@@ -295,7 +298,10 @@ class BatchProcessor:
         return successful > 0
 
 def main():
-    processor = BatchProcessor()
+    program = argparse.ArgumentParser(description="Procesador por lotes de roop")
+    program.add_argument("--metrics-port", type=int, help="publica las métricas de roop en este puerto local (ej. 9100 para monitor_gpu.py)")
+    args = program.parse_args()
+    processor = BatchProcessor(args.metrics_port)
     success = processor.run_batch_processing()
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark de extremo a extremo: mide tiempos por etapa (probe, extract, read,
+detect, swap, enhance, write, encode, mux), frames por segundo y RSS máximo
+sobre videos sintéticos, y compara contra una línea base guardada
+
+Uso: python -m benchmarks.run --resolutions 360 720 --face-totals 1 4 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import onnxruntime
+import psutil
+
+import roop.globals
+from benchmarks.synthetic import SOURCE_IMAGE, create_synthetic_video
+from roop.core import decode_execution_providers
+from roop.face_analyser import analyse_source_face, get_many_faces, warm_up_face_analyser
+from roop.probe import get_media_info, clear_media_infos
+from roop.processors.frame.core import get_frame_processors_modules
+from roop.thread_budget import apply_thread_budget, clear_thread_budget, format_thread_budget
+from roop.utilities import create_temp, extract_frames, get_temp_frame_paths, create_video, restore_audio, clean_temp
+
+STAGES = ["probe", "extract", "read", "detect", "swap", "enhance", "write", "encode", "mux"]
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEOS_DIR = os.path.join(BENCHMARK_DIR, "videos")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+class PeakMemorySampler(threading.Thread):
+    """Muestrea el RSS del proceso y sus hijos (ffmpeg) en segundo plano"""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        process = psutil.Process(os.getpid())
+        while not self.stopped.is_set():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak_rss
+
+
+def setup_globals(args, frame_processors):
+    """Configura roop.globals como lo haría run.py en modo headless"""
+    roop.globals.headless = True
+    roop.globals.frame_processors = frame_processors
+    roop.globals.many_faces = True
+    roop.globals.keep_fps = True
+    roop.globals.keep_frames = False
+    roop.globals.skip_audio = False
+    roop.globals.temp_frame_format = args.temp_frame_format
+    roop.globals.temp_frame_quality = 0
+    roop.globals.output_video_encoder = "libx264"
+    roop.globals.output_video_quality = 35
+    roop.globals.execution_providers = decode_execution_providers(args.execution_provider)
+    roop.globals.execution_threads = args.execution_threads
+    roop.globals.execution_replicas = 0
+    roop.globals.face_analyser_max_num = 0
+    clear_thread_budget()
+    return apply_thread_budget()
+
+
+def time_stage(timings, lock, stage, function, *function_args):
+    start_time = time.perf_counter()
+    result = function(*function_args)
+    with lock:
+        timings[stage] += time.perf_counter() - start_time
+    return result
+
+
+def process_benchmark_frame(pipeline, source_face, temp_frame_path, timings, lock):
+    """Procesa un frame midiendo cada etapa por separado"""
+    temp_frame = time_stage(timings, lock, "read", cv2.imread, temp_frame_path)
+    target_faces = time_stage(timings, lock, "detect", get_many_faces, temp_frame) or []
+    if target_faces and "face_swapper" in pipeline:
+        from roop.processors.frame.face_swapper import swap_faces
+        temp_frame = time_stage(timings, lock, "swap", swap_faces, source_face, target_faces, temp_frame)
+    if target_faces and "face_enhancer" in pipeline:
+        from roop.processors.frame.face_enhancer import enhance_face
+        for target_face in target_faces:
+            temp_frame = time_stage(timings, lock, "enhance", enhance_face, target_face, temp_frame)
+    time_stage(timings, lock, "write", cv2.imwrite, temp_frame_path, temp_frame)
+
+
+def run_case(pipeline, target_path, output_path, source_face):
+    """Ejecuta el pipeline completo sobre un video y devuelve sus métricas"""
+    timings = dict.fromkeys(STAGES, 0.0)
+    lock = threading.Lock()
+    sampler = PeakMemorySampler()
+    sampler.start()
+    start_time = time.perf_counter()
+
+    clear_media_infos()
+    media_info = time_stage(timings, lock, "probe", get_media_info, target_path)
+    fps = media_info.fps if media_info else 30
+    create_temp(target_path)
+    time_stage(timings, lock, "extract", extract_frames, target_path, fps)
+    temp_frame_paths = sorted(get_temp_frame_paths(target_path))
+
+    process_start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=roop.globals.execution_threads) as executor:
+        futures = [executor.submit(process_benchmark_frame, pipeline, source_face, temp_frame_path, timings, lock) for temp_frame_path in temp_frame_paths]
+        for future in futures:
+            future.result()
+    process_seconds = time.perf_counter() - process_start_time
+
+    time_stage(timings, lock, "encode", create_video, target_path, fps)
+    time_stage(timings, lock, "mux", restore_audio, target_path, output_path)
+    clean_temp(target_path)
+    total_seconds = time.perf_counter() - start_time
+    peak_rss = sampler.stop()
+
+    frame_total = len(temp_frame_paths)
+    return {
+        "frames": frame_total,
+        "stage_seconds": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        "stage_milliseconds_per_frame": {stage: round(seconds * 1000 / max(frame_total, 1), 3) for stage, seconds in timings.items()},
+        "process_fps": round(frame_total / max(process_seconds, 1e-6), 3),
+        "end_to_end_fps": round(frame_total / max(total_seconds, 1e-6), 3),
+        "total_seconds": round(total_seconds, 3),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1)
+    }
+
+
+def get_environment(thread_budget):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "onnxruntime": onnxruntime.__version__,
+        "execution_providers": roop.globals.execution_providers,
+        "execution_threads": thread_budget.execution_threads,
+        "thread_budget": format_thread_budget(thread_budget)
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Devuelve la lista de regresiones respecto a la línea base"""
+    regressions = []
+    for case_name, case_result in results["cases"].items():
+        baseline_case = baseline.get("cases", {}).get(case_name)
+        if not baseline_case:
+            continue
+        for metric in ["process_fps", "end_to_end_fps"]:
+            if case_result[metric] < baseline_case[metric] * (1 - tolerance):
+                regressions.append(f"{case_name}: {metric} {baseline_case[metric]} -> {case_result[metric]}")
+        if case_result["peak_rss_mb"] > baseline_case["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{case_name}: peak_rss_mb {baseline_case['peak_rss_mb']} -> {case_result['peak_rss_mb']}")
+        for stage in STAGES:
+            current_milliseconds = case_result["stage_milliseconds_per_frame"][stage]
+            baseline_milliseconds = baseline_case["stage_milliseconds_per_frame"].get(stage, 0)
+            if baseline_milliseconds >= 1 and current_milliseconds > baseline_milliseconds * (1 + tolerance):
+                regressions.append(f"{case_name}: {stage} {baseline_milliseconds} ms/frame -> {current_milliseconds} ms/frame")
+    return regressions
+
+
+def parse_args():
+    program = argparse.ArgumentParser(description="Benchmark reproducible del pipeline de roop")
+    program.add_argument("--pipelines", nargs="+", default=["face_swapper", "face_swapper,face_enhancer"], help="procesadores separados por comas, un pipeline por valor")
+    program.add_argument("--resolutions", nargs="+", type=int, default=[360, 720], help="alturas de los videos sintéticos")
+    program.add_argument("--face-totals", nargs="+", type=int, default=[1, 4], help="número de rostros por frame")
+    program.add_argument("--frame-total", type=int, default=60, help="frames por video sintético")
+    program.add_argument("--execution-provider", nargs="+", default=["cpu"], help="proveedor de ejecución")
+    program.add_argument("--execution-threads", type=int, default=None, help="hilos de ejecución (por defecto el presupuesto de hilos)")
+    program.add_argument("--temp-frame-format", default="png", choices=["jpg", "png"])
+    program.add_argument("--output", default=None, help="archivo JSON de resultados")
+    program.add_argument("--baseline", default=None, help="línea base JSON contra la que comparar")
+    program.add_argument("--save-baseline", default=None, help="guarda esta ejecución como línea base")
+    program.add_argument("--tolerance", type=float, default=0.1, help="margen de regresión permitido (0.1 = 10%%)")
+    return program.parse_args()
+
+
+def main():
+    args = parse_args()
+    pipelines = [pipeline.split(",") for pipeline in args.pipelines]
+    frame_processors = list(dict.fromkeys(frame_processor for pipeline in pipelines for frame_processor in pipeline))
+    thread_budget = setup_globals(args, frame_processors)
+    os.makedirs(VIDEOS_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    print("⏱️  Benchmark de roop")
+    print(f"   Proveedores: {roop.globals.execution_providers} | {thread_budget.execution_threads} hilos | {format_thread_budget(thread_budget)}")
+    print("=" * 60)
+
+    for frame_processor in get_frame_processors_modules(frame_processors):
+        if not frame_processor.pre_check():
+            sys.exit(1)
+        if hasattr(frame_processor, "warm_up"):
+            frame_processor.warm_up()
+    warm_up_face_analyser()
+    source_face = analyse_source_face(cv2.imread(SOURCE_IMAGE))
+
+    results = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "environment": get_environment(thread_budget), "cases": {}}
+    for height in args.resolutions:
+        for face_total in args.face_totals:
+            target_path = create_synthetic_video(os.path.join(VIDEOS_DIR, f"synthetic-{height}p-{face_total}faces-{args.frame_total}f.mp4"), height, face_total, args.frame_total)
+            for pipeline in pipelines:
+                case_name = f"{'+'.join(pipeline)}-{height}p-{face_total}faces"
+                output_path = os.path.join(RESULTS_DIR, f"{case_name}.mp4")
+                print(f"🎬 {case_name}")
+                case_result = run_case(pipeline, target_path, output_path, source_face)
+                results["cases"][case_name] = case_result
+                print(f"   {case_result['process_fps']} fps procesando | {case_result['end_to_end_fps']} fps total | {case_result['peak_rss_mb']} MB RSS máximo")
+
+    output_path = args.output or os.path.join(RESULTS_DIR, time.strftime("benchmark-%Y%m%d-%H%M%S.json"))
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=4)
+    print(f"✅ Resultados guardados en {output_path}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f"✅ Línea base guardada en {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regresiones respecto a {args.baseline}:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"✅ Sin regresiones respecto a {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Genera videos sintéticos reproducibles para los benchmarks a partir de
+.github/examples, repitiendo el rostro en cuadrícula según el número de rostros
+"""
+
+import math
+import os
+import subprocess
+
+import cv2
+import numpy
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".github", "examples")
+SOURCE_IMAGE = os.path.join(EXAMPLES_DIR, "source.jpg")
+TARGET_VIDEO = os.path.join(EXAMPLES_DIR, "target.mp4")
+
+
+def read_base_frames(frame_total):
+    """Lee los frames base del video de ejemplo o, si no existe, anima la imagen fuente"""
+    base_frames = []
+    if os.path.isfile(TARGET_VIDEO):
+        capture = cv2.VideoCapture(TARGET_VIDEO)
+        while len(base_frames) < frame_total:
+            has_frame, frame = capture.read()
+            if not has_frame:
+                break
+            base_frames.append(frame)
+        capture.release()
+    if not base_frames:
+        source_frame = cv2.imread(SOURCE_IMAGE)
+        for index in range(frame_total):
+            shift = int(8 * math.sin(index / 6))
+            base_frames.append(numpy.roll(source_frame, shift, axis=1))
+    return base_frames
+
+
+def create_grid_frame(frame, face_total, width, height):
+    """Coloca face_total copias del frame en una cuadrícula del tamaño indicado"""
+    columns = math.ceil(math.sqrt(face_total))
+    rows = math.ceil(face_total / columns)
+    cell_width, cell_height = width // columns, height // rows
+    grid_frame = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+    for index in range(face_total):
+        row, column = divmod(index, columns)
+        grid_frame[row * cell_height:(row + 1) * cell_height, column * cell_width:(column + 1) * cell_width] = cv2.resize(frame, (cell_width, cell_height))
+    return grid_frame
+
+
+def create_synthetic_video(output_path, height, face_total, frame_total, fps=30):
+    """Crea un video con audio silencioso de la resolución y número de rostros indicados"""
+    if os.path.isfile(output_path):
+        return output_path
+    width = int(round(height * 16 / 9 / 2)) * 2
+    base_frames = read_base_frames(frame_total)
+    silent_path = output_path + ".silent.mp4"
+    writer = cv2.VideoWriter(silent_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for index in range(frame_total):
+        writer.write(create_grid_frame(base_frames[index % len(base_frames)], face_total, width, height))
+    writer.release()
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", silent_path,
+        "-f", "lavfi", "-i", "anullsrc=channel_layout=stereo:sample_rate=44100",
+        "-map", "0:v:0", "-map", "1:a:0", "-shortest",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+        output_path
+    ], check=True)
+    os.remove(silent_path)
+    return output_path
@@ -53,14 +53,11 @@ FACE_DETECTION_CONFIG = {
 EXECUTION_CONFIG = {
     "execution_provider": "cuda",
     "max_memory": "12",
-    "execution_threads": "30",
+    "autotune": True,
     "keep_fps": True,
     "keep_frames": True
 }
 
-# Cache para análisis automático
-AUTO_ANALYSIS_CACHE = {}
-
 def get_face_args_for_video(video_path):
     """
     Obtiene argumentos específicos para un video basado en su nombre
@@ -81,15 +78,10 @@ def get_auto_analysis_args(video_path):
     Convierte el análisis automático (dict) en argumentos de CLI (lista de strings)
     """
     try:
-        from video_analyzer import VideoAnalyzer
+        from video_analyzer import get_analyzer, write_face_timeline
         
-        # Verificar cache local de args
-        if video_path in AUTO_ANALYSIS_CACHE:
-            config = AUTO_ANALYSIS_CACHE[video_path]
-        else:
-            analyzer = VideoAnalyzer()
-            config = analyzer.analyze_video_auto(video_path)  # dict
-            AUTO_ANALYSIS_CACHE[video_path] = config
+        # El analizador compartido consulta su cache por contenido antes de analizar
+        config = get_analyzer().analyze_video_auto(video_path)  # dict
         
         if not isinstance(config, dict):
             return None
@@ -103,6 +95,13 @@ def get_auto_analysis_args(video_path):
             "--reference-face-position", str(config.get("reference_face_position", "0"))
         ])
         
+        args.extend(get_performance_args(config.get("performance_profile")))
+        
+        # Segmentos sin rostros que roop puede saltarse
+        timeline_path = write_face_timeline(video_path, config)
+        if timeline_path:
+            args.extend(["--face-timeline", timeline_path])
+        
         return args
         
     except ImportError:
@@ -112,6 +111,25 @@ def get_auto_analysis_args(video_path):
         print(f"⚠️  Error en análisis automático: {e}")
         return None
 
+def get_performance_args(profile):
+    """
+    Convierte el perfil de rendimiento del análisis en argumentos de CLI
+    """
+    if not isinstance(profile, dict):
+        return []
+    
+    args = [
+        "--face-detector-size", str(profile.get("face_detector_size", 640)),
+        "--temp-frame-format", profile.get("temp_frame_format", "png")
+    ]
+    if profile.get("temp_frame_format") == "jpg":
+        args.extend(["--temp-frame-quality", str(profile.get("temp_frame_quality", "0"))])
+    if profile.get("execution_threads"):
+        args.extend(["--execution-threads", str(profile["execution_threads"])])
+    if profile.get("output_video_preset"):
+        args.extend(["--output-video-preset", profile["output_video_preset"]])
+    return args
+
 def get_name_based_config(video_path):
     """
     Obtiene configuración basada en el nombre del video
@@ -155,37 +173,9 @@ def analyze_all_videos_in_folder(folder_path="videos_input"):
     """
     Analiza automáticamente todos los videos en una carpeta
     """
-    folder = Path(folder_path)
-    if not folder.exists():
-        print(f"❌ La carpeta {folder_path} no existe")
-        return
-    
-    video_extensions = ['*.mp4', '*.avi', '*.mov', '*.mkv', '*.wmv', '*.flv']
-    video_files = []
-    
-    for ext in video_extensions:
-        video_files.extend(folder.glob(ext))
-    
-    if not video_files:
-        print(f"⚠️  No se encontraron videos en {folder_path}")
-        return
-    
-    print(f"🔍 Analizando {len(video_files)} videos automáticamente...")
-    print("=" * 60)
-    
     try:
-        from video_analyzer import VideoAnalyzer
-        analyzer = VideoAnalyzer()
-        
-        for video_file in video_files:
-            try:
-                analyzer.analyze_video_auto(str(video_file))
-                analyzer.print_analysis_report(str(video_file))
-            except Exception as e:
-                print(f"❌ Error analizando {video_file.name}: {e}")
-        
-        print("\n✅ Análisis automático completado")
-        print("💡 Los resultados se usarán automáticamente en el procesamiento")
+        from video_analyzer import get_analyzer
+        get_analyzer().analyze_all_videos_in_folder(folder_path)
         
     except ImportError:
         print("❌ El analizador automático no está disponible")
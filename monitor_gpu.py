@@ -1,66 +1,71 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
 import time
-import subprocess
-import threading
-import psutil
+import urllib.request
 
-def monitor_gpu_usage():
-    """Monitorea el uso de GPU en tiempo real"""
-    print("🔍 Monitoreando uso de GPU...")
-    print("=" * 50)
-    
-    def get_gpu_info():
-        try:
-            # Usar nvidia-smi para obtener info de GPU
-            result = subprocess.run(['nvidia-smi', '--query-gpu=memory.used,memory.total,utilization.gpu', '--format=csv,noheader,nounits'], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                for line in lines:
-                    if line.strip():
-                        used, total, util = line.split(', ')
-                        return {
-                            'memory_used': int(used),
-                            'memory_total': int(total),
-                            'utilization': int(util)
-                        }
-        except Exception as e:
-            print(f"Error obteniendo info GPU: {e}")
+def read_metrics(source):
+    """Lee las métricas de roop desde el endpoint /metrics.json o desde el archivo JSON"""
+    try:
+        if source.startswith("http"):
+            with urllib.request.urlopen(source, timeout=2) as response:
+                return json.loads(response.read())
+        with open(source) as metrics_file:
+            return json.load(metrics_file)
+    except Exception:
         return None
-    
-    def get_system_memory():
-        memory = psutil.virtual_memory()
-        return {
-            'used': memory.used / (1024**3),  # GB
-            'total': memory.total / (1024**3),  # GB
-            'percent': memory.percent
-        }
-    
+
+def get_value(metrics, kind, name):
+    return sum(metric["value"] for metric in metrics[kind] if metric["name"] == name)
+
+def monitor_gpu_usage(source, interval=2):
+    """Monitorea en tiempo real las métricas publicadas por roop (--metrics-port / --metrics-path)"""
+    print("🔍 Monitoreando métricas de roop...")
+    print(f"   Fuente: {source}")
+    print("=" * 50)
     print("⏱️  Monitoreo iniciado. Presiona Ctrl+C para detener.")
     print("=" * 50)
-    
+
+    last_frames = None
+    last_time = None
     try:
         while True:
-            gpu_info = get_gpu_info()
-            sys_memory = get_system_memory()
-            
-            if gpu_info:
-                gpu_memory_gb = gpu_info['memory_used'] / 1024
-                gpu_total_gb = gpu_info['memory_total'] / 1024
-                gpu_percent = (gpu_info['memory_used'] / gpu_info['memory_total']) * 100
-                
-                print(f"🖥️  GPU: {gpu_memory_gb:.1f}GB / {gpu_total_gb:.1f}GB ({gpu_percent:.1f}%) | Util: {gpu_info['utilization']}%")
-            else:
-                print("🖥️  GPU: No disponible")
-            
-            print(f"💾 RAM: {sys_memory['used']:.1f}GB / {sys_memory['total']:.1f}GB ({sys_memory['percent']:.1f}%)")
+            metrics = read_metrics(source)
+            if not metrics:
+                print("⏳ Esperando métricas de roop...")
+                time.sleep(interval)
+                continue
+
+            frames = get_value(metrics, "counters", "frames_processed_total")
+            now = time.time()
+            fps = (frames - last_frames) / (now - last_time) if last_frames is not None and now > last_time else 0
+            last_frames, last_time = frames, now
+
+            rss_gb = get_value(metrics, "gauges", "memory_rss_bytes") / 1024 ** 3
+            gpu_gb = get_value(metrics, "gauges", "gpu_memory_reserved_bytes") / 1024 ** 3
+            queue_depth = get_value(metrics, "gauges", "queue_depth")
+            pool_waiting = get_value(metrics, "gauges", "model_pool_waiting")
+
+            print(f"🎞️  Frames: {int(frames)} | {fps:.1f} fps | Cola: {int(queue_depth)} | Esperando modelo: {int(pool_waiting)}")
+            print(f"💾 RAM (RSS): {rss_gb:.2f}GB | 🖥️  GPU reservada (torch): {gpu_gb:.2f}GB")
+            for histogram in sorted(metrics["histograms"], key=lambda histogram: histogram["sum"], reverse=True):
+                quantiles = histogram["quantiles"]
+                stage = histogram["labels"].get("stage", "")
+                if histogram["name"] == "stage_seconds":
+                    print(f"   ⏱️  {stage}: p50 {float(quantiles['0.5']) * 1000:.1f}ms | p95 {float(quantiles['0.95']) * 1000:.1f}ms | p99 {float(quantiles['0.99']) * 1000:.1f}ms")
+                elif histogram["name"] == "faces_per_frame":
+                    print(f"   🙂 {stage}: {histogram['sum'] / max(histogram['count'], 1):.2f} rostros/frame")
             print("-" * 50)
-            
-            time.sleep(2)
-            
+
+            time.sleep(interval)
+
     except KeyboardInterrupt:
         print("\n⏹️  Monitoreo detenido.")
 
 if __name__ == "__main__":
-    monitor_gpu_usage() 
\ No newline at end of file
+    program = argparse.ArgumentParser(description="Monitor de métricas de roop")
+    program.add_argument("source", nargs="?", default="http://127.0.0.1:9100/metrics.json", help="URL de /metrics.json (--metrics-port) o archivo de --metrics-path")
+    program.add_argument("--interval", type=float, default=2, help="segundos entre lecturas")
+    args = program.parse_args()
+    monitor_gpu_usage(args.source, args.interval)
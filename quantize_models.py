@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Genera variantes INT8 de los modelos (detector, reconocedor e inswapper) para
+ejecutar con --model-precision int8 en CPU, y compara su precisión con fp32
+"""
+
+import argparse
+import json
+import sys
+
+import roop.globals
+from roop.quantizer import quantize_models
+
+
+def print_report(quantization_report):
+    print("📊 COMPARACIÓN INT8 vs FP32")
+    print("=" * 60)
+    for model_name, model_report in quantization_report.items():
+        print(f"🧠 {model_name} ({model_report['samples']} muestras)")
+        print(f"   fp32: {model_report['fp32_milliseconds']} ms | int8: {model_report['int8_milliseconds']} ms | aceleración: x{model_report['speedup']}")
+        if 'psnr_mean' in model_report:
+            print(f"   PSNR medio: {model_report['psnr_mean']} dB (mínimo {model_report['psnr_min']} dB)")
+        else:
+            print(f"   Deriva coseno media: {model_report['cosine_drift_mean']} (máxima {model_report['cosine_drift_max']})")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    program = argparse.ArgumentParser(description="Cuantiza los modelos a INT8 usando frames locales como calibración")
+    program.add_argument("paths", nargs="*", default=["source", "videos_input"], help="imágenes, videos o carpetas para la calibración")
+    program.add_argument("--frame-total", type=int, default=64, help="número de frames de calibración")
+    program.add_argument("--method", default="static", choices=["static", "dynamic"], help="cuantización estática (calibrada) o dinámica")
+    program.add_argument("--report", default="quantization_report.json", help="archivo JSON del informe de comparación")
+    args = program.parse_args()
+
+    roop.globals.execution_providers = ["CPUExecutionProvider"]
+
+    print(f"🔧 Cuantizando modelos ({args.method}) con {args.frame_total} frames de: {', '.join(args.paths)}")
+    try:
+        quantization_report = quantize_models(args.paths, args.frame_total, args.method)
+    except Exception as e:
+        print(f"❌ Error durante la cuantización: {e}")
+        sys.exit(1)
+
+    print_report(quantization_report)
+    with open(args.report, "w") as report_file:
+        json.dump(quantization_report, report_file, indent=4)
+    print(f"✅ Informe guardado en {args.report}")
+    print("💡 Usa --model-precision int8 para cargar los modelos cuantizados")
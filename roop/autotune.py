@@ -0,0 +1,218 @@
+import json
+import os
+import platform
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import cv2
+
+import roop.globals
+from roop.capturer import get_video_frame, get_video_frame_total, clear_video_captures
+from roop.face_analyser import get_one_face, analyse_source_face, clear_face_analyser
+from roop.processors.frame.core import get_frame_processors_modules
+from roop.thread_budget import get_cpu_cores, has_gpu_execution, suggest_execution_threads, apply_thread_budget, clear_thread_budget
+from roop.typing import AutotuneConfig, Face, Frame
+from roop.utilities import resolve_relative_path, is_image, is_video
+
+AUTOTUNE_PATH = resolve_relative_path('../autotune.json')
+AUTOTUNE_SAMPLE_TOTAL = 4
+AUTOTUNE_TRIAL_FRAME_TOTAL = 32
+AUTOTUNE_TRIAL_SECONDS = 1.5
+AUTOTUNE_BATCH_SIZES = [1, 4]
+AUTOTUNE_REPLICAS_MAX = 8
+AUTOTUNE_GPU_REPLICAS_MAX = 4
+THREAD_LOCK = threading.Lock()
+
+
+def get_autotune_key() -> str:
+    return '|'.join([
+        platform.node(),
+        platform.machine(),
+        platform.processor(),
+        str(get_cpu_cores()),
+        ','.join(roop.globals.execution_providers),
+        str(roop.globals.execution_threads or 'auto'),
+        str(roop.globals.execution_batch_size or 'auto'),
+        str(roop.globals.execution_replicas or 'auto'),
+        str(roop.globals.execution_intra_op_threads or 'auto'),
+        roop.globals.execution_graph_optimization or 'all',
+        roop.globals.execution_mode or 'sequential',
+        roop.globals.model_precision or 'fp32',
+        roop.globals.face_analyser_model or 'buffalo_l',
+        str(roop.globals.face_detector_size or 640),
+        roop.globals.face_detector_mode or 'whole',
+        str(roop.globals.face_detector_sweep_interval or 1) if roop.globals.face_detector_roi else 'full',
+        ','.join(roop.globals.frame_processors)
+    ])
+
+
+def load_autotune_configs() -> Dict[str, Any]:
+    if os.path.isfile(AUTOTUNE_PATH):
+        try:
+            with open(AUTOTUNE_PATH) as autotune_file:
+                return json.load(autotune_file)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+
+def load_autotune_config(autotune_key: str) -> Optional[AutotuneConfig]:
+    autotune_config = load_autotune_configs().get(autotune_key)
+    if autotune_config:
+        try:
+            return AutotuneConfig(**autotune_config)
+        except TypeError:
+            return None
+    return None
+
+
+def save_autotune_config(autotune_key: str, autotune_config: AutotuneConfig) -> None:
+    with THREAD_LOCK:
+        autotune_configs = load_autotune_configs()
+        autotune_configs[autotune_key] = autotune_config._asdict()
+        with open(AUTOTUNE_PATH, 'w') as autotune_file:
+            json.dump(autotune_configs, autotune_file, indent=4)
+
+
+def apply_autotune_config(autotune_config: AutotuneConfig) -> None:
+    if not roop.globals.execution_threads:
+        roop.globals.execution_threads = autotune_config.execution_threads
+    if not roop.globals.execution_batch_size:
+        roop.globals.execution_batch_size = autotune_config.execution_batch_size
+    if not roop.globals.execution_replicas:
+        roop.globals.execution_replicas = autotune_config.execution_replicas
+    if not roop.globals.execution_intra_op_threads and not has_gpu_execution(roop.globals.execution_providers):
+        roop.globals.execution_intra_op_threads = autotune_config.intra_op_threads
+    clear_thread_budget()
+
+
+def autotune() -> Optional[AutotuneConfig]:
+    autotune_key = get_autotune_key()
+    autotune_config = load_autotune_config(autotune_key)
+    if autotune_config is None:
+        autotune_config = calibrate()
+        if autotune_config:
+            save_autotune_config(autotune_key, autotune_config)
+    if autotune_config:
+        apply_autotune_config(autotune_config)
+    return autotune_config
+
+
+def get_execution_replicas_candidates(execution_threads: int) -> List[int]:
+    if roop.globals.execution_replicas:
+        return [roop.globals.execution_replicas]
+    if has_gpu_execution(roop.globals.execution_providers):
+        return sorted({0, min(execution_threads, AUTOTUNE_GPU_REPLICAS_MAX)} - {1})
+    return sorted({1, min(execution_threads, AUTOTUNE_REPLICAS_MAX)})
+
+
+def get_autotune_candidates(cpu_cores: int) -> List[Tuple[int, int, int, int]]:
+    execution_providers = roop.globals.execution_providers
+    execution_threads_limit = suggest_execution_threads(execution_providers, cpu_cores) if has_gpu_execution(execution_providers) else cpu_cores
+    execution_threads_candidates = [roop.globals.execution_threads] if roop.globals.execution_threads else [2 ** exponent for exponent in range(8) if 2 ** exponent <= execution_threads_limit]
+    batch_size_candidates = [roop.globals.execution_batch_size] if roop.globals.execution_batch_size else AUTOTUNE_BATCH_SIZES
+    candidates = []
+    for execution_threads in execution_threads_candidates:
+        for execution_replicas in get_execution_replicas_candidates(execution_threads):
+            concurrent_sessions = max(1, min(execution_threads, execution_replicas or execution_threads))
+            if roop.globals.execution_intra_op_threads:
+                intra_op_threads_candidates = [roop.globals.execution_intra_op_threads]
+            elif has_gpu_execution(execution_providers):
+                intra_op_threads_candidates = [1]
+            else:
+                intra_op_threads_candidates = sorted({max(1, cpu_cores // concurrent_sessions), max(1, cpu_cores // (concurrent_sessions * 2))})
+            for intra_op_threads in intra_op_threads_candidates:
+                for batch_size in batch_size_candidates:
+                    if execution_threads * batch_size <= AUTOTUNE_TRIAL_FRAME_TOTAL or batch_size == batch_size_candidates[0]:
+                        candidates.append((intra_op_threads, execution_replicas, execution_threads, batch_size))
+    return sorted(candidates)
+
+
+def get_calibration_frames() -> List[Frame]:
+    target_path = roop.globals.target_path
+    if is_image(target_path):
+        return [cv2.imread(target_path)]
+    if is_video(target_path):
+        frame_total = get_video_frame_total(target_path)
+        frame_numbers = sorted({1 + frame_total * index // AUTOTUNE_SAMPLE_TOTAL for index in range(AUTOTUNE_SAMPLE_TOTAL)})
+        calibration_frames = [get_video_frame(target_path, frame_number) for frame_number in frame_numbers]
+        clear_video_captures()
+        return [calibration_frame for calibration_frame in calibration_frames if calibration_frame is not None]
+    return []
+
+
+def process_calibration_frames(source_face: Face, reference_face: Optional[Face], calibration_frames: List[Frame]) -> None:
+    for calibration_frame in calibration_frames:
+        temp_frame = calibration_frame.copy()
+        for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+            temp_frame = frame_processor.process_frame(source_face, reference_face, temp_frame)
+
+
+def process_trial_batches(source_face: Face, reference_face: Optional[Face], calibration_frames: List[Frame], batch_size: int, offset: int, end_time: float) -> int:
+    frame_total = 0
+    while True:
+        process_calibration_frames(source_face, reference_face, [calibration_frames[(offset + frame_total + index) % len(calibration_frames)] for index in range(batch_size)])
+        frame_total += batch_size
+        if time.perf_counter() >= end_time:
+            return frame_total
+
+
+def measure_frames_per_second(source_face: Face, reference_face: Optional[Face], calibration_frames: List[Frame], execution_threads: int, batch_size: int, trial_seconds: float = AUTOTUNE_TRIAL_SECONDS) -> float:
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=execution_threads) as executor:
+        futures = [executor.submit(process_trial_batches, source_face, reference_face, calibration_frames, batch_size, offset, start_time + trial_seconds) for offset in range(execution_threads)]
+        frame_total = sum(future.result() for future in futures)
+    return frame_total / max(time.perf_counter() - start_time, 1e-6)
+
+
+def clear_calibration_models() -> None:
+    for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+        frame_processor.post_process()
+    clear_face_analyser()
+
+
+def calibrate() -> Optional[AutotuneConfig]:
+    calibration_frames = get_calibration_frames()
+    if not calibration_frames or not is_image(roop.globals.source_path):
+        return None
+    source_face = analyse_source_face(cv2.imread(roop.globals.source_path))
+    if not source_face:
+        return None
+    reference_face = None if roop.globals.many_faces else get_one_face(calibration_frames[0], roop.globals.reference_face_position or 0)
+    execution_threads, execution_batch_size, execution_replicas, intra_op_threads = roop.globals.execution_threads, roop.globals.execution_batch_size, roop.globals.execution_replicas, roop.globals.execution_intra_op_threads
+    autotune_config = None
+    autotune_candidates = get_autotune_candidates(get_cpu_cores())
+    session_candidate_totals = Counter((candidate[0], candidate[1]) for candidate in autotune_candidates)
+    current_sessions = None
+    trial_seconds = AUTOTUNE_TRIAL_SECONDS
+    try:
+        for candidate_intra_op_threads, candidate_execution_replicas, candidate_execution_threads, candidate_batch_size in autotune_candidates:
+            roop.globals.execution_threads = candidate_execution_threads
+            roop.globals.execution_batch_size = candidate_batch_size
+            roop.globals.execution_replicas = candidate_execution_replicas
+            roop.globals.execution_intra_op_threads = candidate_intra_op_threads
+            clear_thread_budget()
+            thread_budget = apply_thread_budget()
+            if (candidate_intra_op_threads, candidate_execution_replicas) != current_sessions:
+                clear_calibration_models()
+                current_sessions = candidate_intra_op_threads, candidate_execution_replicas
+                load_start_time = time.perf_counter()
+                measure_frames_per_second(source_face, reference_face, calibration_frames, thread_budget.execution_replicas, 1, 0)
+                session_seconds = AUTOTUNE_TRIAL_SECONDS * session_candidate_totals[current_sessions]
+                trial_seconds = max(0.0, session_seconds - (time.perf_counter() - load_start_time)) / session_candidate_totals[current_sessions]
+            frames_per_second = measure_frames_per_second(source_face, reference_face, calibration_frames, candidate_execution_threads, candidate_batch_size, trial_seconds)
+            if autotune_config is None or frames_per_second > autotune_config.frames_per_second:
+                autotune_config = AutotuneConfig(
+                    execution_threads=candidate_execution_threads,
+                    execution_replicas=candidate_execution_replicas,
+                    execution_batch_size=candidate_batch_size,
+                    intra_op_threads=candidate_intra_op_threads,
+                    frames_per_second=round(frames_per_second, 2)
+                )
+    finally:
+        roop.globals.execution_threads, roop.globals.execution_batch_size, roop.globals.execution_replicas, roop.globals.execution_intra_op_threads = execution_threads, execution_batch_size, execution_replicas, intra_op_threads
+        clear_calibration_models()
+        clear_thread_budget()
+    return autotune_config
@@ -1,22 +1,104 @@
-from typing import Optional
+import bisect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
 import cv2
 
+from roop.probe import get_media_info, get_media_keyframes
 from roop.typing import Frame
 
+VIDEO_CAPTURES: Dict[str, Any] = {}
+VIDEO_POSITIONS: Dict[str, int] = {}
+VIDEO_FRAMES: 'OrderedDict[Tuple[str, int], Frame]' = OrderedDict()
+VIDEO_FRAMES_MEMORY = 0
+VIDEO_FRAMES_MEMORY_MAX = 128 * 1024 * 1024
+VIDEO_PREFETCH_TOTAL = 2
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+THREAD_LOCK = threading.Lock()
+
 
 def get_video_frame(video_path: str, frame_number: int = 0) -> Optional[Frame]:
-    capture = cv2.VideoCapture(video_path)
-    frame_total = capture.get(cv2.CAP_PROP_FRAME_COUNT)
-    capture.set(cv2.CAP_PROP_POS_FRAMES, min(frame_total, frame_number - 1))
-    has_frame, frame = capture.read()
-    capture.release()
-    if has_frame:
-        return frame
+    frame_index = get_video_frame_index(video_path, frame_number)
+    frame = read_video_frame(video_path, frame_index)
+    if frame is not None:
+        PREFETCH_EXECUTOR.submit(prefetch_video_frames, video_path, frame_index + 1)
+        return frame.copy()
     return None
 
 
 def get_video_frame_total(video_path: str) -> int:
+    media_info = get_media_info(video_path)
+    if media_info and media_info.frame_total:
+        return media_info.frame_total
     capture = cv2.VideoCapture(video_path)
     video_frame_total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
     capture.release()
     return video_frame_total
+
+
+def get_video_frame_index(video_path: str, frame_number: int) -> int:
+    frame_total = get_video_frame_total(video_path)
+    if frame_total:
+        return max(0, min(frame_total - 1, frame_number - 1))
+    return max(0, frame_number - 1)
+
+
+def get_video_keyframe(video_path: str, frame_index: int) -> int:
+    keyframes = get_media_keyframes(video_path)
+    if keyframes:
+        return keyframes[max(0, bisect.bisect_right(keyframes, frame_index) - 1)]
+    return frame_index
+
+
+def get_video_capture(video_path: str) -> Any:
+    if video_path not in VIDEO_CAPTURES:
+        VIDEO_CAPTURES[video_path] = cv2.VideoCapture(video_path)
+        VIDEO_POSITIONS[video_path] = 0
+    return VIDEO_CAPTURES[video_path]
+
+
+def read_video_frame(video_path: str, frame_index: int) -> Optional[Frame]:
+    global VIDEO_FRAMES_MEMORY
+
+    with THREAD_LOCK:
+        if (video_path, frame_index) in VIDEO_FRAMES:
+            VIDEO_FRAMES.move_to_end((video_path, frame_index))
+            return VIDEO_FRAMES[(video_path, frame_index)]
+        capture = get_video_capture(video_path)
+        position = VIDEO_POSITIONS[video_path]
+        keyframe = get_video_keyframe(video_path, frame_index)
+        if frame_index < position or keyframe > position:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            position = keyframe
+        while position < frame_index and capture.grab():
+            position += 1
+        has_frame, frame = capture.read()
+        VIDEO_POSITIONS[video_path] = position + 1 if has_frame else position
+        if has_frame and position == frame_index:
+            VIDEO_FRAMES[(video_path, frame_index)] = frame
+            VIDEO_FRAMES_MEMORY += frame.nbytes
+            while VIDEO_FRAMES_MEMORY > VIDEO_FRAMES_MEMORY_MAX and len(VIDEO_FRAMES) > 1:
+                VIDEO_FRAMES_MEMORY -= VIDEO_FRAMES.popitem(last=False)[1].nbytes
+            return frame
+    return None
+
+
+def prefetch_video_frames(video_path: str, frame_index: int) -> None:
+    frame_total = get_video_frame_total(video_path)
+    for prefetch_index in range(frame_index, min(frame_index + VIDEO_PREFETCH_TOTAL, frame_total)):
+        if video_path not in VIDEO_CAPTURES:
+            return
+        read_video_frame(video_path, prefetch_index)
+
+
+def clear_video_captures() -> None:
+    global VIDEO_FRAMES_MEMORY
+
+    with THREAD_LOCK:
+        for capture in VIDEO_CAPTURES.values():
+            capture.release()
+        VIDEO_CAPTURES.clear()
+        VIDEO_POSITIONS.clear()
+        VIDEO_FRAMES.clear()
+        VIDEO_FRAMES_MEMORY = 0
@@ -2,9 +2,11 @@
 
 import os
 import sys
+import time
+START_TIME = time.perf_counter()
 # single thread doubles cuda performance - needs to be set before torch import
-if any(arg.startswith('--execution-provider') for arg in sys.argv):
-    os.environ['OMP_NUM_THREADS'] = '1'
+# torch threads are sized later by the thread budget
+os.environ.setdefault('OMP_NUM_THREADS', '1')
 # reduce tensorflow log level
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 import warnings
@@ -14,13 +16,18 @@ import signal
 import shutil
 import argparse
 import onnxruntime
-import tensorflow
 import roop.globals
 import roop.metadata
-import roop.ui as ui
-from roop.predictor import predict_image, predict_video
-from roop.processors.frame.core import get_frame_processors_modules
-from roop.utilities import has_image_extension, is_image, is_video, detect_fps, create_video, extract_frames, get_temp_frame_paths, restore_audio, create_temp, move_temp, clean_temp, normalize_output_path
+from roop.autotune import autotune
+from roop.face_reference import has_scene_cut_consumers, set_scene_cuts
+from roop.face_timeline import filter_face_timeline
+from roop.memory_profiler import start_memory_profile, record_memory, write_memory_profile, format_memory_summary
+from roop.metrics import start_metrics
+from roop.processors.frame.core import get_frame_processors_modules, warm_up_frame_processors
+from roop.thread_budget import apply_thread_budget, format_thread_budget
+from roop.tracer import write_trace
+from roop.utilities import has_image_extension, is_image, is_video, detect_fps, detect_scene_cuts, create_video, extract_frames, get_temp_frame_paths, restore_audio, create_temp, move_temp, clean_temp, normalize_output_path
+IMPORT_TIME = time.perf_counter() - START_TIME
 
 warnings.filterwarnings('ignore', category=FutureWarning, module='insightface')
 warnings.filterwarnings('ignore', category=UserWarning, module='torchvision')
@@ -39,16 +46,42 @@ def parse_args() -> None:
     program.add_argument('--many-faces', help='process every face', dest='many_faces', action='store_true')
     program.add_argument('--reference-face-position', help='position of the reference face', dest='reference_face_position', type=int, default=0)
     program.add_argument('--reference-frame-number', help='number of the reference frame', dest='reference_frame_number', type=int, default=0)
+    program.add_argument('--reference-per-scene', help='refresh the reference face after every scene cut', dest='reference_per_scene', action='store_true')
+    program.add_argument('--scene-cut-threshold', help='scene change score (0-1) that starts a new scene', dest='scene_cut_threshold', type=float, default=0.4)
     program.add_argument('--similar-face-distance', help='face distance used for recognition', dest='similar_face_distance', type=float, default=0.85)
+    program.add_argument('--face-analyser-max-num', help='maximum number of faces analysed per frame (0 for all)', dest='face_analyser_max_num', type=int, default=0)
+    program.add_argument('--face-analyser-model', help='face analyser model pack (buffalo_l is the most accurate, buffalo_sc the fastest, hybrid pairs the fast detector with the accurate recognizer)', dest='face_analyser_model', default='buffalo_l', choices=['buffalo_l', 'buffalo_m', 'buffalo_s', 'buffalo_sc', 'hybrid'])
+    program.add_argument('--face-detector-size', help='input size of the face detector (smaller is faster, larger finds smaller faces)', dest='face_detector_size', type=int, default=640, choices=[320, 480, 640, 800, 960, 1280])
+    program.add_argument('--face-detector-mode', help='whole frame detection, adaptive refinement of small faces at native resolution or tiled detection for crowds', dest='face_detector_mode', default='whole', choices=['whole', 'adaptive', 'tiled'])
+    program.add_argument('--face-detector-roi', help='detect only around the faces of the previous frame between full frame sweeps', dest='face_detector_roi', action='store_true')
+    program.add_argument('--face-detector-sweep-interval', help='number of frames between full frame sweeps of the roi detection', dest='face_detector_sweep_interval', type=int, default=10)
+    program.add_argument('--largest-face-first', help='order detected faces by size', dest='largest_face_first', action='store_true')
+    program.add_argument('--face-timeline', help='skip segments without faces listed in this timeline (video_analyzer.py)', dest='face_timeline_path')
     program.add_argument('--temp-frame-format', help='image format used for frame extraction', dest='temp_frame_format', default='png', choices=['jpg', 'png'])
     program.add_argument('--temp-frame-quality', help='image quality used for frame extraction', dest='temp_frame_quality', type=int, default=0, choices=range(101), metavar='[0-100]')
     program.add_argument('--output-video-encoder', help='encoder used for the output video', dest='output_video_encoder', default='libx264', choices=['libx264', 'libx265', 'libvpx-vp9', 'h264_nvenc', 'hevc_nvenc'])
     program.add_argument('--output-video-quality', help='quality used for the output video', dest='output_video_quality', type=int, default=35, choices=range(101), metavar='[0-100]')
+    program.add_argument('--output-video-preset', help='encoder preset used for the output video (ultrafast to veryslow)', dest='output_video_preset', choices=['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow'], metavar='OUTPUT_VIDEO_PRESET')
     program.add_argument('--max-memory', help='maximum amount of RAM in GB', dest='max_memory', type=int)
     # Set default to cuda if available, otherwise cpu
     default_provider = ['cuda'] if 'CUDAExecutionProvider' in onnxruntime.get_available_providers() else ['cpu']
     program.add_argument('--execution-provider', help='available execution provider (choices: cpu, ...)', dest='execution_provider', default=default_provider, choices=suggest_execution_providers(), nargs='+')
-    program.add_argument('--execution-threads', help='number of execution threads', dest='execution_threads', type=int, default=suggest_execution_threads())
+    program.add_argument('--execution-threads', help='number of execution threads', dest='execution_threads', type=int)
+    program.add_argument('--execution-batch-size', help='number of frames per execution thread task (0 for auto)', dest='execution_batch_size', type=int, default=0)
+    program.add_argument('--execution-replicas', help='number of model replicas shared by the execution threads (0 for auto)', dest='execution_replicas', type=int, default=0)
+    program.add_argument('--execution-intra-op-threads', help='number of threads per model replica (0 for auto)', dest='execution_intra_op_threads', type=int, default=0)
+    program.add_argument('--execution-cores', help='number of cpu cores shared by all thread pools (0 for all)', dest='execution_cores', type=int, default=0)
+    program.add_argument('--execution-graph-optimization', help='graph optimization level of the model sessions', dest='execution_graph_optimization', default='all', choices=['disable', 'basic', 'extended', 'all'])
+    program.add_argument('--execution-mode', help='execution mode of the model sessions', dest='execution_mode', default='sequential', choices=['sequential', 'parallel'])
+    program.add_argument('--execution-disable-memory-arena', help='disable the cpu memory arena of the model sessions', dest='execution_disable_memory_arena', action='store_true')
+    program.add_argument('--execution-arena-strategy', help='cuda memory arena extend strategy of the model sessions', dest='execution_arena_strategy', default='next_power_of_two', choices=['next_power_of_two', 'same_as_requested'])
+    program.add_argument('--model-precision', help='precision of the models (int8 requires quantize_models.py)', dest='model_precision', default='fp32', choices=['fp32', 'int8'])
+    program.add_argument('--autotune', help='calibrate and store the fastest execution settings', dest='autotune', action='store_true')
+    program.add_argument('--trace', help='write a chrome trace of the processing to this file', dest='trace_path')
+    program.add_argument('--metrics-port', help='serve prometheus metrics on this localhost port', dest='metrics_port', type=int)
+    program.add_argument('--metrics-path', help='write json metrics to this file every second', dest='metrics_path')
+    program.add_argument('--memory-profile', help='write rss and tracemalloc snapshots at stage boundaries to this file', dest='memory_profile_path')
+    program.add_argument('--memory-profile-interval', help='number of frames between memory snapshots', dest='memory_profile_interval', type=int, default=100)
     program.add_argument('-v', '--version', action='version', version=f'{roop.metadata.name} {roop.metadata.version}')
 
     args = program.parse_args()
@@ -64,14 +97,40 @@ def parse_args() -> None:
     roop.globals.many_faces = args.many_faces
     roop.globals.reference_face_position = args.reference_face_position
     roop.globals.reference_frame_number = args.reference_frame_number
+    roop.globals.reference_per_scene = args.reference_per_scene
+    roop.globals.scene_cut_threshold = args.scene_cut_threshold
     roop.globals.similar_face_distance = args.similar_face_distance
+    roop.globals.face_analyser_max_num = args.face_analyser_max_num
+    roop.globals.face_analyser_model = args.face_analyser_model
+    roop.globals.face_detector_size = args.face_detector_size
+    roop.globals.face_detector_mode = args.face_detector_mode
+    roop.globals.face_detector_roi = args.face_detector_roi
+    roop.globals.face_detector_sweep_interval = args.face_detector_sweep_interval
+    roop.globals.largest_face_first = args.largest_face_first
+    roop.globals.face_timeline_path = args.face_timeline_path
     roop.globals.temp_frame_format = args.temp_frame_format
     roop.globals.temp_frame_quality = args.temp_frame_quality
     roop.globals.output_video_encoder = args.output_video_encoder
     roop.globals.output_video_quality = args.output_video_quality
+    roop.globals.output_video_preset = args.output_video_preset
     roop.globals.max_memory = args.max_memory
     roop.globals.execution_providers = decode_execution_providers(args.execution_provider)
     roop.globals.execution_threads = args.execution_threads
+    roop.globals.execution_batch_size = args.execution_batch_size
+    roop.globals.execution_replicas = args.execution_replicas
+    roop.globals.execution_intra_op_threads = args.execution_intra_op_threads
+    roop.globals.execution_cores = args.execution_cores
+    roop.globals.execution_graph_optimization = args.execution_graph_optimization
+    roop.globals.execution_mode = args.execution_mode
+    roop.globals.execution_disable_memory_arena = args.execution_disable_memory_arena
+    roop.globals.execution_arena_strategy = args.execution_arena_strategy
+    roop.globals.model_precision = args.model_precision
+    roop.globals.autotune = args.autotune
+    roop.globals.trace_path = args.trace_path
+    roop.globals.metrics_port = args.metrics_port
+    roop.globals.metrics_path = args.metrics_path
+    roop.globals.memory_profile_path = args.memory_profile_path
+    roop.globals.memory_profile_interval = args.memory_profile_interval
 
 
 def encode_execution_providers(execution_providers: List[str]) -> List[str]:
@@ -87,23 +146,7 @@ def suggest_execution_providers() -> List[str]:
     return encode_execution_providers(onnxruntime.get_available_providers())
 
 
-def suggest_execution_threads() -> int:
-    if 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
-        # Tesla T4 tiene 15GB VRAM, usar 8 threads para optimizar
-        return 12
-    return 1
-
-
 def limit_resources() -> None:
-    # prevent tensorflow memory leak
-    gpus = tensorflow.config.experimental.list_physical_devices('GPU')
-    for gpu in gpus:
-        # Increase memory limit for CUDA if available
-        # Tesla T4 has 15GB VRAM, use 12GB to leave room for system
-        memory_limit = 12288 if 'CUDAExecutionProvider' in roop.globals.execution_providers else 12288
-        tensorflow.config.experimental.set_virtual_device_configuration(gpu, [
-            tensorflow.config.experimental.VirtualDeviceConfiguration(memory_limit=memory_limit)
-        ])
     # limit memory usage
     if roop.globals.max_memory:
         memory = roop.globals.max_memory * 1024 ** 3
@@ -131,6 +174,7 @@ def pre_check() -> bool:
 def update_status(message: str, scope: str = 'ROOP.CORE') -> None:
     print(f'[{scope}] {message}')
     if not roop.globals.headless:
+        import roop.ui as ui
         ui.update_status(message)
 
 
@@ -140,6 +184,7 @@ def start() -> None:
             return
     # process image to image
     if has_image_extension(roop.globals.target_path):
+        # from roop.predictor import predict_image
         # if predict_image(roop.globals.target_path):
         #     destroy()
         shutil.copy2(roop.globals.target_path, roop.globals.output_path)
@@ -148,6 +193,7 @@ def start() -> None:
             update_status('Progressing...', frame_processor.NAME)
             frame_processor.process_image(roop.globals.source_path, roop.globals.output_path, roop.globals.output_path)
             frame_processor.post_process()
+            record_memory(f'post_process:{frame_processor.NAME}')
         # validate image
         if is_image(roop.globals.target_path):
             update_status('Processing to image succeed!')
@@ -155,10 +201,12 @@ def start() -> None:
             update_status('Processing to image failed!')
         return
     # process image to videos
+    # from roop.predictor import predict_video
     # if predict_video(roop.globals.target_path):
     #     destroy()
     update_status('Creating temporary resources...')
     create_temp(roop.globals.target_path)
+    warm_up_futures = warm_up_frame_processors(roop.globals.frame_processors)
     # extract frames
     if roop.globals.keep_fps:
         fps = detect_fps(roop.globals.target_path)
@@ -167,13 +215,27 @@ def start() -> None:
     else:
         update_status('Extracting frames with 30 FPS...')
         extract_frames(roop.globals.target_path)
+    set_scene_cuts([])
+    if has_scene_cut_consumers():
+        update_status('Detecting scene cuts...')
+        set_scene_cuts(detect_scene_cuts(roop.globals.target_path, detect_fps(roop.globals.target_path) if roop.globals.keep_fps else 30))
     # process frame
     temp_frame_paths = get_temp_frame_paths(roop.globals.target_path)
     if temp_frame_paths:
+        if not all(warm_up_future.done() for warm_up_future in warm_up_futures):
+            update_status('Waiting for models to warm up...')
+        for warm_up_future in warm_up_futures:
+            warm_up_future.result()
+        record_memory('models_loaded')
+        if roop.globals.face_timeline_path:
+            face_frame_paths = filter_face_timeline(temp_frame_paths, detect_fps(roop.globals.target_path) if roop.globals.keep_fps else 30)
+            update_status(f'Skipping {len(temp_frame_paths) - len(face_frame_paths)} frames without faces...')
+            temp_frame_paths = face_frame_paths
         for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
             update_status('Progressing...', frame_processor.NAME)
             frame_processor.process_video(roop.globals.source_path, temp_frame_paths)
             frame_processor.post_process()
+            record_memory(f'post_process:{frame_processor.NAME}')
     else:
         update_status('Frames not found...')
         return
@@ -208,6 +270,8 @@ def start() -> None:
 def destroy() -> None:
     if roop.globals.target_path:
         clean_temp(roop.globals.target_path)
+    write_trace()
+    write_memory_profile()
     sys.exit()
 
 
@@ -219,8 +283,23 @@ def run() -> None:
         if not frame_processor.pre_check():
             return
     limit_resources()
+    if not start_metrics(roop.globals.metrics_port):
+        update_status(f'Metrics port {roop.globals.metrics_port} is not available, continuing without the metrics endpoint...')
+    start_memory_profile()
+    if roop.globals.autotune:
+        if roop.globals.headless:
+            update_status('Autotuning execution threads, batch size, model replicas and intra-op threads...')
+        autotune()
+    thread_budget = apply_thread_budget()
     if roop.globals.headless:
+        update_status(f'Using {thread_budget.execution_threads} execution threads and {thread_budget.execution_replicas} {"shared " if thread_budget.shared_replicas else ""}model replicas with {format_thread_budget(thread_budget)} threads...')
+        update_status(f'Started in {time.perf_counter() - START_TIME:.2f} seconds ({IMPORT_TIME:.2f} seconds importing modules)...')
         start()
+        write_trace()
+        memory_summary = write_memory_profile()
+        if memory_summary:
+            update_status(format_memory_summary(memory_summary))
     else:
+        import roop.ui as ui
         window = ui.init(start, destroy)
         window.mainloop()
@@ -1,37 +1,132 @@
+import math
+import os
 import threading
-from typing import Any, Optional, List
-import insightface
+from contextlib import contextmanager
+from typing import Any, ContextManager, Dict, Iterator, Optional, List, Tuple
 import numpy
-import onnxruntime
+from insightface.utils import ensure_available
 
 import roop.globals
-from roop.typing import Frame, Face
+from roop.face_reference import get_scene_index
+from roop.model_pool import checkout_model, clear_model_pool, warm_up_model
+from roop.processors.frame.core import get_frame_processors_modules
+from roop.session import load_model, warm_up_session
+from roop.tracer import trace_span
+from roop.typing import Frame, Face, Detection
 
-FACE_ANALYSER = None
-THREAD_LOCK = threading.Lock()
+FACE_ANALYSER_MODULES = ['detection', 'recognition', 'genderage', 'landmark_2d_106', 'landmark_3d_68']
+FACE_ANALYSER_MODELS = {
+    'buffalo_l': {
+        'detection': 'buffalo_l/det_10g.onnx',
+        'recognition': 'buffalo_l/w600k_r50.onnx',
+        'genderage': 'buffalo_l/genderage.onnx',
+        'landmark_2d_106': 'buffalo_l/2d106det.onnx',
+        'landmark_3d_68': 'buffalo_l/1k3d68.onnx'
+    },
+    'buffalo_m': {
+        'detection': 'buffalo_m/det_2.5g.onnx',
+        'recognition': 'buffalo_m/w600k_r50.onnx',
+        'genderage': 'buffalo_m/genderage.onnx',
+        'landmark_2d_106': 'buffalo_m/2d106det.onnx',
+        'landmark_3d_68': 'buffalo_m/1k3d68.onnx'
+    },
+    'buffalo_s': {
+        'detection': 'buffalo_s/det_500m.onnx',
+        'recognition': 'buffalo_s/w600k_mbf.onnx',
+        'genderage': 'buffalo_s/genderage.onnx',
+        'landmark_2d_106': 'buffalo_s/2d106det.onnx',
+        'landmark_3d_68': 'buffalo_s/1k3d68.onnx'
+    },
+    'buffalo_sc': {
+        'detection': 'buffalo_sc/det_500m.onnx',
+        'recognition': 'buffalo_sc/w600k_mbf.onnx'
+    },
+    'hybrid': {
+        'detection': 'buffalo_s/det_500m.onnx',
+        'recognition': 'buffalo_l/w600k_r50.onnx',
+        'genderage': 'buffalo_l/genderage.onnx',
+        'landmark_2d_106': 'buffalo_l/2d106det.onnx',
+        'landmark_3d_68': 'buffalo_l/1k3d68.onnx'
+    }
+}
+FACE_SOURCE_RECOGNIZER = 'buffalo_l/w600k_r50.onnx'
+FACE_DETECTOR_REFINE_SIZE = 48
+FACE_DETECTOR_REFINE_SCALE = 2.5
+FACE_DETECTOR_TILE_OVERLAP = 0.125
+FACE_DETECTOR_ROI_SCALE = 2.0
+FACE_TRACKER = threading.local()
 
 
-def get_face_analyser() -> Any:
-    global FACE_ANALYSER
+def get_face_analyser() -> ContextManager[Dict[str, Any]]:
+    return checkout_model('face_analyser', create_face_analyser)
 
-    with THREAD_LOCK:
-        if FACE_ANALYSER is None:
-            # Forzar uso de CUDA si está disponible
-            providers = roop.globals.execution_providers
-            if 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
-                # Asegurar que CUDA esté primero en la lista
-                providers = ['CUDAExecutionProvider'] + [p for p in providers if p != 'CUDAExecutionProvider']
-                print(f"[FACE_ANALYSER] Usando providers: {providers}")
-            
-            FACE_ANALYSER = insightface.app.FaceAnalysis(name='buffalo_l', providers=providers)
-            FACE_ANALYSER.prepare(ctx_id=0)
-    return FACE_ANALYSER
 
+def get_face_analyser_models() -> Dict[str, str]:
+    return FACE_ANALYSER_MODELS[roop.globals.face_analyser_model or 'buffalo_l']
 
-def clear_face_analyser() -> Any:
-    global FACE_ANALYSER
 
-    FACE_ANALYSER = None
+def get_face_analyser_model_path(face_analyser_module: str) -> str:
+    return resolve_face_analyser_model(get_face_analyser_models()[face_analyser_module])
+
+
+def resolve_face_analyser_model(face_analyser_model: str) -> str:
+    model_pack, model_file = face_analyser_model.split('/')
+    return os.path.join(ensure_available('models', model_pack, root='~/.insightface'), model_file)
+
+
+def get_model_version(face_analyser_model: str) -> str:
+    return os.path.splitext(os.path.basename(face_analyser_model))[0]
+
+
+def get_embedding_version() -> str:
+    return get_model_version(get_face_analyser_models()['recognition'])
+
+
+def get_source_recognizer() -> ContextManager[Any]:
+    return checkout_model('source_recognizer', create_source_recognizer)
+
+
+def create_source_recognizer() -> Any:
+    source_recognizer = load_model(resolve_face_analyser_model(FACE_SOURCE_RECOGNIZER))
+    source_recognizer.prepare(ctx_id=0)
+    return source_recognizer
+
+
+def create_face_analyser() -> Dict[str, Any]:
+    face_analyser = {}
+    for face_analyser_module in get_face_analyser_modules():
+        face_analyser[face_analyser_module] = load_model(get_face_analyser_model_path(face_analyser_module))
+        if face_analyser_module == 'detection':
+            face_analyser[face_analyser_module].prepare(ctx_id=0, input_size=(roop.globals.face_detector_size or 640, roop.globals.face_detector_size or 640), det_thresh=0.5)
+        else:
+            face_analyser[face_analyser_module].prepare(ctx_id=0)
+    return face_analyser
+
+
+def warm_up_face_analyser() -> None:
+    warm_up_model('face_analyser', create_face_analyser, warm_up_face_analyser_modules)
+
+
+def warm_up_face_analyser_modules(face_analyser: Dict[str, Any]) -> None:
+    for face_analyser_module, model in face_analyser.items():
+        if face_analyser_module == 'detection':
+            warm_up_session(model.session, roop.globals.face_detector_size or 640)
+        else:
+            warm_up_session(model.session)
+
+
+def get_face_analyser_modules() -> List[str]:
+    face_analyser_modules = ['detection']
+    for frame_processor_module in get_frame_processors_modules(roop.globals.frame_processors):
+        for face_analyser_module in getattr(frame_processor_module, 'FACE_ANALYSER_MODULES', FACE_ANALYSER_MODULES):
+            if face_analyser_module not in face_analyser_modules and face_analyser_module in get_face_analyser_models():
+                face_analyser_modules.append(face_analyser_module)
+    return face_analyser_modules
+
+
+def clear_face_analyser() -> Any:
+    clear_model_pool('face_analyser')
+    clear_model_pool('source_recognizer')
 
 
 def get_one_face(frame: Frame, position: int = 0) -> Optional[Face]:
@@ -44,18 +139,189 @@ def get_one_face(frame: Frame, position: int = 0) -> Optional[Face]:
     return None
 
 
+def analyse_source_face(frame: Frame) -> Optional[Face]:
+    source_face = get_one_face(frame)
+    if source_face:
+        return embed_source_face(frame, source_face)
+    return None
+
+
+def embed_source_face(frame: Frame, face: Face) -> Face:
+    if face.embedding_version != get_model_version(FACE_SOURCE_RECOGNIZER):
+        with get_source_recognizer() as source_recognizer, trace_span('face_analyser.source_recognizer'):
+            source_recognizer.get(frame, face)
+        face.embedding_version = get_model_version(FACE_SOURCE_RECOGNIZER)
+    return face
+
+
 def get_many_faces(frame: Frame) -> Optional[List[Face]]:
     try:
-        return get_face_analyser().get(frame)
+        return analyse_faces(frame)
     except ValueError:
         return None
 
 
+def get_face_detector_size() -> int:
+    return roop.globals.face_detector_size or 640
+
+
+def detect_region(face_detector: Any, frame: Frame, region: Tuple[int, int, int, int], input_size: int) -> Detection:
+    left, top, right, bottom = region
+    bboxes, kpss = face_detector.detect(frame[top:bottom, left:right], input_size=(input_size, input_size), metric='default')
+    bboxes[:, [0, 2]] += left
+    bboxes[:, [1, 3]] += top
+    if kpss is not None:
+        kpss[:, :, 0] += left
+        kpss[:, :, 1] += top
+    return bboxes, kpss
+
+
+def merge_detections(face_detector: Any, detections: List[Detection]) -> Detection:
+    bboxes = numpy.vstack([bboxes for bboxes, _ in detections])
+    kpss = numpy.vstack([kpss for _, kpss in detections]) if all(kpss is not None for _, kpss in detections) else None
+    if len(bboxes) == 0:
+        return bboxes, kpss
+    keep = face_detector.nms(bboxes)
+    return bboxes[keep], kpss[keep] if kpss is not None else None
+
+
+def limit_detections(detection: Detection) -> Detection:
+    bboxes, kpss = detection
+    max_num = roop.globals.face_analyser_max_num or 0
+    if max_num and len(bboxes) > max_num:
+        order = numpy.argsort((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1]))[::-1][:max_num]
+        return bboxes[order], kpss[order] if kpss is not None else None
+    return bboxes, kpss
+
+
+def get_intersection_over_union(bbox: numpy.ndarray[Any, Any], bboxes: numpy.ndarray[Any, Any]) -> numpy.ndarray[Any, Any]:
+    width = numpy.maximum(0, numpy.minimum(bbox[2], bboxes[:, 2]) - numpy.maximum(bbox[0], bboxes[:, 0]))
+    height = numpy.maximum(0, numpy.minimum(bbox[3], bboxes[:, 3]) - numpy.maximum(bbox[1], bboxes[:, 1]))
+    intersection = width * height
+    union = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) + (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1]) - intersection
+    return intersection / numpy.maximum(union, 1e-6)
+
+
+def detect_faces_adaptive(face_detector: Any, frame: Frame) -> Detection:
+    bboxes, kpss = face_detector.detect(frame, metric='default')
+    frame_height, frame_width = frame.shape[:2]
+    detector_scale = get_face_detector_size() / max(frame_width, frame_height)
+    if detector_scale >= 1:
+        return bboxes, kpss
+    for index, bbox in enumerate(bboxes):
+        face_size = max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+        if face_size * detector_scale >= FACE_DETECTOR_REFINE_SIZE:
+            continue
+        region_size = int(face_size * FACE_DETECTOR_REFINE_SCALE)
+        left = max(0, min(int((bbox[0] + bbox[2] - region_size) / 2), frame_width - region_size))
+        top = max(0, min(int((bbox[1] + bbox[3] - region_size) / 2), frame_height - region_size))
+        region = (left, top, min(frame_width, left + region_size), min(frame_height, top + region_size))
+        input_size = min(get_face_detector_size(), math.ceil(region_size / 32) * 32)
+        region_bboxes, region_kpss = detect_region(face_detector, frame, region, input_size)
+        if len(region_bboxes):
+            intersection_over_union = get_intersection_over_union(bbox, region_bboxes)
+            region_index = int(numpy.argmax(intersection_over_union))
+            if intersection_over_union[region_index] > 0.3:
+                bboxes[index] = region_bboxes[region_index]
+                if kpss is not None and region_kpss is not None:
+                    kpss[index] = region_kpss[region_index]
+    return bboxes, kpss
+
+
+def get_tile_positions(frame_size: int, tile_size: int) -> List[int]:
+    if frame_size <= tile_size:
+        return [0]
+    tile_stride = int(tile_size * (1 - FACE_DETECTOR_TILE_OVERLAP))
+    tile_positions = list(range(0, frame_size - tile_size, tile_stride))
+    return tile_positions + [frame_size - tile_size]
+
+
+def detect_faces_tiled(face_detector: Any, frame: Frame) -> Detection:
+    frame_height, frame_width = frame.shape[:2]
+    tile_size = get_face_detector_size() * 2
+    detections = [face_detector.detect(frame, metric='default')]
+    if max(frame_width, frame_height) > tile_size:
+        for top in get_tile_positions(frame_height, tile_size):
+            for left in get_tile_positions(frame_width, tile_size):
+                detections.append(detect_region(face_detector, frame, (left, top, min(frame_width, left + tile_size), min(frame_height, top + tile_size)), get_face_detector_size()))
+    return merge_detections(face_detector, detections)
+
+
+@contextmanager
+def track_faces(frame_number: int) -> Iterator[None]:
+    FACE_TRACKER.frame_number = frame_number
+    try:
+        yield
+    finally:
+        FACE_TRACKER.frame_number = None
+
+
+def can_track_faces(frame_number: Optional[int]) -> bool:
+    previous_frame_number = getattr(FACE_TRACKER, 'previous_frame_number', None)
+    if frame_number is None or previous_frame_number != frame_number - 1:
+        return False
+    if get_scene_index(frame_number) != get_scene_index(previous_frame_number):
+        return False
+    return frame_number - FACE_TRACKER.sweep_frame_number < (roop.globals.face_detector_sweep_interval or 1)
+
+
+def detect_faces_roi(face_detector: Any, frame: Frame) -> Detection:
+    frame_number = getattr(FACE_TRACKER, 'frame_number', None)
+    if not can_track_faces(frame_number):
+        detection = detect_faces(face_detector, frame)
+        FACE_TRACKER.sweep_frame_number = frame_number
+    else:
+        frame_height, frame_width = frame.shape[:2]
+        previous_bboxes, previous_kpss = FACE_TRACKER.detection
+        region_detections: List[Detection] = [(previous_bboxes[:0], previous_kpss[:0] if previous_kpss is not None else None)]
+        for bbox in previous_bboxes:
+            region_size = int(max(bbox[2] - bbox[0], bbox[3] - bbox[1]) * FACE_DETECTOR_ROI_SCALE)
+            left = max(0, min(int((bbox[0] + bbox[2] - region_size) / 2), frame_width - region_size))
+            top = max(0, min(int((bbox[1] + bbox[3] - region_size) / 2), frame_height - region_size))
+            region = (left, top, min(frame_width, left + region_size), min(frame_height, top + region_size))
+            region_detections.append(detect_region(face_detector, frame, region, min(get_face_detector_size(), max(32, math.ceil(region_size / 32) * 32))))
+        detection = limit_detections(merge_detections(face_detector, region_detections))
+        if len(detection[0]) < len(previous_bboxes):
+            detection = detect_faces(face_detector, frame)
+            FACE_TRACKER.sweep_frame_number = frame_number
+    FACE_TRACKER.previous_frame_number = frame_number
+    FACE_TRACKER.detection = detection
+    return detection
+
+
+def detect_faces(face_detector: Any, frame: Frame) -> Detection:
+    if roop.globals.face_detector_mode == 'adaptive':
+        return limit_detections(detect_faces_adaptive(face_detector, frame))
+    if roop.globals.face_detector_mode == 'tiled':
+        return limit_detections(detect_faces_tiled(face_detector, frame))
+    return limit_detections(face_detector.detect(frame, metric='default'))
+
+
+def analyse_faces(frame: Frame) -> List[Face]:
+    many_faces = []
+    with get_face_analyser() as face_analyser:
+        with trace_span('face_analyser.detect', mode=roop.globals.face_detector_mode or 'whole') as span:
+            bboxes, kpss = detect_faces_roi(face_analyser['detection'], frame) if roop.globals.face_detector_roi else detect_faces(face_analyser['detection'], frame)
+            span['faces'] = len(bboxes)
+        with trace_span('face_analyser.analyse', faces=len(bboxes)):
+            for index, bbox in enumerate(bboxes):
+                face = Face(bbox=bbox[0:4], kps=kpss[index] if kpss is not None else None, det_score=bbox[4])
+                for face_analyser_module, model in face_analyser.items():
+                    if face_analyser_module != 'detection':
+                        model.get(frame, face)
+                if 'recognition' in face_analyser:
+                    face.embedding_version = get_embedding_version()
+                many_faces.append(face)
+    if roop.globals.largest_face_first:
+        many_faces.sort(key=lambda face: (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]), reverse=True)
+    return many_faces
+
+
 def find_similar_face(frame: Frame, reference_face: Face) -> Optional[Face]:
     many_faces = get_many_faces(frame)
     if many_faces:
         for face in many_faces:
-            if hasattr(face, 'normed_embedding') and hasattr(reference_face, 'normed_embedding'):
+            if hasattr(face, 'normed_embedding') and hasattr(reference_face, 'normed_embedding') and face.embedding_version == reference_face.embedding_version:
                 distance = numpy.sum(numpy.square(face.normed_embedding - reference_face.normed_embedding))
                 if distance < roop.globals.similar_face_distance:
                     return face
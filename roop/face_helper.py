@@ -0,0 +1,78 @@
+import threading
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy
+
+from roop.typing import Frame, Matrix
+
+CROP_MASKS: Dict[Tuple[int, int], Frame] = {}
+THREAD_LOCK = threading.Lock()
+FFHQ_TEMPLATE = numpy.array([
+    [192.98138, 239.94708],
+    [318.90277, 240.1936],
+    [256.63416, 314.01935],
+    [201.26117, 371.41043],
+    [313.08905, 371.15118]
+], dtype=numpy.float32)
+
+
+def get_crop_mask(crop_size: Tuple[int, int]) -> Frame:
+    with THREAD_LOCK:
+        if crop_size not in CROP_MASKS:
+            CROP_MASKS[crop_size] = numpy.full(crop_size, 255, dtype=numpy.float32)
+    return CROP_MASKS[crop_size]
+
+
+def warp_face(temp_frame: Frame, kps: Matrix, template: Matrix, crop_size: Tuple[int, int]) -> Tuple[Frame, Matrix]:
+    affine_matrix = cv2.estimateAffinePartial2D(kps, template, method=cv2.LMEDS)[0]
+    crop_frame = cv2.warpAffine(temp_frame, affine_matrix, crop_size, borderMode=cv2.BORDER_CONSTANT, borderValue=(135, 133, 132))
+    return crop_frame, affine_matrix
+
+
+def get_paste_area(temp_frame: Frame, crop_frame: Frame, inverse_matrix: Matrix) -> Tuple[int, int, int, int]:
+    crop_height, crop_width = crop_frame.shape[:2]
+    corners = numpy.array([[0, 0, 1], [crop_width, 0, 1], [0, crop_height, 1], [crop_width, crop_height, 1]], dtype=numpy.float32)
+    points = corners @ inverse_matrix.T
+    start_x, start_y = points.min(axis=0)
+    end_x, end_y = points.max(axis=0)
+    padding = max(int(numpy.sqrt((end_x - start_x) * (end_y - start_y))) // 20, 5) + 1
+    frame_height, frame_width = temp_frame.shape[:2]
+    start_x = max(0, int(start_x) - padding)
+    start_y = max(0, int(start_y) - padding)
+    end_x = min(frame_width, int(numpy.ceil(end_x)) + padding)
+    end_y = min(frame_height, int(numpy.ceil(end_y)) + padding)
+    return start_x, start_y, end_x, end_y
+
+
+def get_mask_size(inverse_crop_mask: Frame) -> int:
+    mask_rows, mask_columns = numpy.nonzero(inverse_crop_mask == 255)
+    if mask_rows.size:
+        return int(numpy.sqrt((mask_rows.max() - mask_rows.min()) * (mask_columns.max() - mask_columns.min())))
+    return 0
+
+
+def get_inverse_crop_mask(crop_frame: Frame, inverse_matrix: Matrix, paste_size: Tuple[int, int]) -> Frame:
+    crop_height, crop_width = crop_frame.shape[:2]
+    inverse_crop_mask = cv2.warpAffine(get_crop_mask((crop_height, crop_width)), inverse_matrix, paste_size, borderValue=0.0)
+    inverse_crop_mask[inverse_crop_mask > 20] = 255
+    mask_size = get_mask_size(inverse_crop_mask)
+    erode_size = max(mask_size // 10, 10)
+    inverse_crop_mask = cv2.erode(inverse_crop_mask, numpy.ones((erode_size, erode_size), numpy.uint8), iterations=1)
+    blur_size = max(mask_size // 20, 5) * 2 + 1
+    return cv2.GaussianBlur(inverse_crop_mask, (blur_size, blur_size), 0) / 255
+
+
+def paste_back(temp_frame: Frame, crop_frame: Frame, affine_matrix: Matrix, crop_mask: Optional[Frame] = None) -> Frame:
+    inverse_matrix = cv2.invertAffineTransform(affine_matrix)
+    start_x, start_y, end_x, end_y = get_paste_area(temp_frame, crop_frame, inverse_matrix)
+    if end_x <= start_x or end_y <= start_y:
+        return temp_frame
+    inverse_matrix[:, 2] -= (start_x, start_y)
+    paste_size = (end_x - start_x, end_y - start_y)
+    inverse_crop_frame = cv2.warpAffine(crop_frame, inverse_matrix, paste_size, borderValue=0.0)
+    inverse_crop_mask = get_inverse_crop_mask(crop_frame, inverse_matrix, paste_size)
+    if crop_mask is not None:
+        inverse_crop_mask = numpy.minimum(inverse_crop_mask, cv2.warpAffine(crop_mask, inverse_matrix, paste_size, flags=cv2.INTER_CUBIC, borderValue=0.0).clip(0, 1))
+    paste_frame = temp_frame[start_y:end_y, start_x:end_x]
+    paste_frame[:] = cv2.blendLinear(inverse_crop_frame, paste_frame, inverse_crop_mask, 1 - inverse_crop_mask)
+    return temp_frame
@@ -1,11 +1,17 @@
-from typing import Optional
+import bisect
+from typing import Dict, List, Optional
 
+import roop.globals
 from roop.typing import Face
 
 FACE_REFERENCE = None
+SCENE_FACE_REFERENCES: Dict[int, Face] = {}
+SCENE_CUTS: List[int] = []
 
 
-def get_face_reference() -> Optional[Face]:
+def get_face_reference(frame_number: Optional[int] = None) -> Optional[Face]:
+    if frame_number is not None:
+        return SCENE_FACE_REFERENCES.get(get_scene_index(frame_number), FACE_REFERENCE)
     return FACE_REFERENCE
 
 
@@ -15,7 +21,30 @@ def set_face_reference(face: Face) -> None:
     FACE_REFERENCE = face
 
 
+def set_scene_face_reference(scene_index: int, face: Face) -> None:
+    SCENE_FACE_REFERENCES[scene_index] = face
+
+
 def clear_face_reference() -> None:
     global FACE_REFERENCE
 
     FACE_REFERENCE = None
+    SCENE_FACE_REFERENCES.clear()
+
+
+def get_scene_cuts() -> List[int]:
+    return SCENE_CUTS
+
+
+def has_scene_cut_consumers() -> bool:
+    return bool(roop.globals.reference_per_scene or roop.globals.face_detector_roi)
+
+
+def set_scene_cuts(scene_cuts: List[int]) -> None:
+    global SCENE_CUTS
+
+    SCENE_CUTS = sorted(scene_cuts)
+
+
+def get_scene_index(frame_number: int) -> int:
+    return bisect.bisect_right(SCENE_CUTS, frame_number)
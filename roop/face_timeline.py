@@ -0,0 +1,47 @@
+import bisect
+import json
+from typing import List
+
+import cv2
+
+import roop.globals
+from roop.face_analyser import get_many_faces
+from roop.tracer import trace_span
+from roop.typing import FaceSegment
+from roop.utilities import get_temp_frame_number
+
+FACE_TIMELINE_CHECK_INTERVAL = 0.5
+
+
+def load_face_timeline(face_timeline_path: str) -> List[FaceSegment]:
+    try:
+        with open(face_timeline_path) as face_timeline_file:
+            face_timeline = json.load(face_timeline_file)
+        return [FaceSegment(float(segment['start']), float(segment['end']), bool(segment['faces'])) for segment in face_timeline.get('segments', [])]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def has_segment_faces(temp_frame_paths: List[str], fps: float) -> bool:
+    check_stride = max(1, round(fps * FACE_TIMELINE_CHECK_INTERVAL))
+    for position in sorted(set(range(0, len(temp_frame_paths), check_stride)) | {len(temp_frame_paths) - 1}):
+        temp_frame = cv2.imread(temp_frame_paths[position])
+        if temp_frame is None or get_many_faces(temp_frame):
+            return True
+    return False
+
+
+def filter_face_timeline(temp_frame_paths: List[str], fps: float) -> List[str]:
+    face_timeline = load_face_timeline(roop.globals.face_timeline_path)
+    temp_frame_paths = sorted(temp_frame_paths, key=get_temp_frame_number)
+    temp_frame_times = [(get_temp_frame_number(temp_frame_path) - 1) / fps for temp_frame_path in temp_frame_paths]
+    skip_frame_paths = set()
+    with trace_span('face_timeline.filter') as span_args:
+        for face_segment in face_timeline:
+            if face_segment.faces:
+                continue
+            segment_frame_paths = temp_frame_paths[bisect.bisect_left(temp_frame_times, face_segment.start):bisect.bisect_right(temp_frame_times, face_segment.end)]
+            if segment_frame_paths and not has_segment_faces(segment_frame_paths, fps):
+                skip_frame_paths.update(segment_frame_paths)
+        span_args['skipped'] = len(skip_frame_paths)
+    return [temp_frame_path for temp_frame_path in temp_frame_paths if temp_frame_path not in skip_frame_paths]
@@ -11,12 +11,38 @@ skip_audio: Optional[bool] = None
 many_faces: Optional[bool] = None
 reference_face_position: Optional[int] = None
 reference_frame_number: Optional[int] = None
+reference_per_scene: Optional[bool] = None
+scene_cut_threshold: Optional[float] = None
 similar_face_distance: Optional[float] = None
+face_analyser_max_num: Optional[int] = None
+face_analyser_model: Optional[str] = None
+face_detector_size: Optional[int] = None
+face_detector_mode: Optional[str] = None
+face_detector_roi: Optional[bool] = None
+face_detector_sweep_interval: Optional[int] = None
+largest_face_first: Optional[bool] = None
+face_timeline_path: Optional[str] = None
 temp_frame_format: Optional[str] = None
 temp_frame_quality: Optional[int] = None
 output_video_encoder: Optional[str] = None
 output_video_quality: Optional[int] = None
+output_video_preset: Optional[str] = None
 max_memory: Optional[int] = None
 execution_providers: List[str] = []
 execution_threads: Optional[int] = None
+execution_batch_size: Optional[int] = None
+execution_replicas: Optional[int] = None
+execution_intra_op_threads: Optional[int] = None
+execution_cores: Optional[int] = None
+execution_graph_optimization: Optional[str] = None
+execution_mode: Optional[str] = None
+execution_disable_memory_arena: Optional[bool] = None
+execution_arena_strategy: Optional[str] = None
+model_precision: Optional[str] = None
+autotune: Optional[bool] = None
+trace_path: Optional[str] = None
+metrics_port: Optional[int] = None
+metrics_path: Optional[str] = None
+memory_profile_path: Optional[str] = None
+memory_profile_interval: Optional[int] = None
 log_level: str = 'error'
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+import roop.globals
+from roop.metrics import sample_memory_usage
+
+MEMORY_SNAPSHOTS: List[Dict[str, Any]] = []
+MEMORY_TOP_ALLOCATORS = 10
+MEMORY_FRAME_TOTAL = 0
+TRACEMALLOC_SNAPSHOT: Optional[tracemalloc.Snapshot] = None
+START_TIME = time.perf_counter()
+THREAD_LOCK = threading.Lock()
+
+
+def is_memory_profiling() -> bool:
+    return bool(roop.globals.memory_profile_path)
+
+
+def start_memory_profile() -> None:
+    if is_memory_profiling() and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        record_memory('start')
+
+
+def get_top_allocators(snapshot: tracemalloc.Snapshot, previous_snapshot: Optional[tracemalloc.Snapshot]) -> List[Dict[str, Any]]:
+    top_allocators = []
+    statistics = snapshot.compare_to(previous_snapshot, 'lineno') if previous_snapshot else snapshot.statistics('lineno')
+    for statistic in statistics[:MEMORY_TOP_ALLOCATORS]:
+        frame = statistic.traceback[0]
+        top_allocators.append({
+            'location': f'{frame.filename}:{frame.lineno}',
+            'size_bytes': statistic.size,
+            'size_diff_bytes': getattr(statistic, 'size_diff', statistic.size),
+            'count': statistic.count
+        })
+    return top_allocators
+
+
+def record_memory(stage: str) -> None:
+    global TRACEMALLOC_SNAPSHOT
+
+    if not is_memory_profiling() or not tracemalloc.is_tracing():
+        return
+    with THREAD_LOCK:
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        traced_memory, traced_peak_memory = tracemalloc.get_traced_memory()
+        MEMORY_SNAPSHOTS.append({
+            'stage': stage,
+            'frames': MEMORY_FRAME_TOTAL,
+            'seconds': round(time.perf_counter() - START_TIME, 3),
+            'rss_bytes': sample_memory_usage(),
+            'traced_bytes': traced_memory,
+            'traced_peak_bytes': traced_peak_memory,
+            'top_allocators': get_top_allocators(snapshot, TRACEMALLOC_SNAPSHOT)
+        })
+        TRACEMALLOC_SNAPSHOT = snapshot
+
+
+def record_frame_memory() -> None:
+    global MEMORY_FRAME_TOTAL
+
+    if not is_memory_profiling():
+        return
+    with THREAD_LOCK:
+        MEMORY_FRAME_TOTAL += 1
+        frame_total = MEMORY_FRAME_TOTAL
+    if frame_total % max(roop.globals.memory_profile_interval or 1, 1) == 0:
+        record_memory('frames')
+
+
+def get_memory_summary() -> Dict[str, Any]:
+    with THREAD_LOCK:
+        memory_snapshots = list(MEMORY_SNAPSHOTS)
+    if not memory_snapshots:
+        return {}
+    peak_snapshot = max(memory_snapshots, key=lambda memory_snapshot: memory_snapshot['rss_bytes'])
+    frame_snapshots = [memory_snapshot for memory_snapshot in memory_snapshots if memory_snapshot['stage'] == 'frames']
+    memory_summary = {
+        'frames': MEMORY_FRAME_TOTAL,
+        'job_growth_bytes': memory_snapshots[-1]['rss_bytes'] - memory_snapshots[0]['rss_bytes'],
+        'peak_rss_bytes': peak_snapshot['rss_bytes'],
+        'peak_stage': peak_snapshot['stage'],
+        'frame_growth_bytes': 0.0,
+        'frame_traced_growth_bytes': 0.0
+    }
+    if len(frame_snapshots) > 1 and frame_snapshots[-1]['frames'] > frame_snapshots[0]['frames']:
+        frame_total = frame_snapshots[-1]['frames'] - frame_snapshots[0]['frames']
+        memory_summary['frame_growth_bytes'] = round((frame_snapshots[-1]['rss_bytes'] - frame_snapshots[0]['rss_bytes']) / frame_total, 1)
+        memory_summary['frame_traced_growth_bytes'] = round((frame_snapshots[-1]['traced_bytes'] - frame_snapshots[0]['traced_bytes']) / frame_total, 1)
+    return memory_summary
+
+
+def format_memory_summary(memory_summary: Dict[str, Any]) -> str:
+    return f'Memory grew {memory_summary["job_growth_bytes"] / 1024 / 1024:.1f} MB per job and {memory_summary["frame_growth_bytes"] / 1024:.1f} KB per frame, peaking at {memory_summary["peak_rss_bytes"] / 1024 / 1024:.1f} MB at {memory_summary["peak_stage"]}...'
+
+
+def write_memory_profile() -> Optional[Dict[str, Any]]:
+    if not is_memory_profiling() or not tracemalloc.is_tracing():
+        return None
+    record_memory('end')
+    memory_summary = get_memory_summary()
+    with open(roop.globals.memory_profile_path, 'w') as memory_profile_file:
+        json.dump({'summary': memory_summary, 'snapshots': MEMORY_SNAPSHOTS}, memory_profile_file, indent=4)
+    tracemalloc.stop()
+    return memory_summary
@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+import psutil
+
+import roop.globals
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+METRIC_COUNTERS: Dict[MetricKey, float] = {}
+METRIC_GAUGES: Dict[MetricKey, float] = {}
+METRIC_HISTOGRAMS: Dict[MetricKey, Deque[float]] = {}
+METRIC_HISTOGRAM_TOTALS: Dict[MetricKey, Tuple[int, float]] = {}
+METRIC_HISTOGRAM_SIZE = 4096
+METRIC_QUANTILES = [0.5, 0.95, 0.99]
+METRIC_SAMPLE_INTERVAL = 1.0
+METRIC_THREADS: List[threading.Thread] = []
+START_TIME = time.time()
+THREAD_LOCK = threading.Lock()
+
+
+def is_metrics_enabled() -> bool:
+    return bool(roop.globals.metrics_port or roop.globals.metrics_path)
+
+
+def get_metric_key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted(labels.items()))
+
+
+def increment_counter(name: str, value: float = 1, **labels: str) -> None:
+    metric_key = get_metric_key(name, labels)
+    with THREAD_LOCK:
+        METRIC_COUNTERS[metric_key] = METRIC_COUNTERS.get(metric_key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    with THREAD_LOCK:
+        METRIC_GAUGES[get_metric_key(name, labels)] = value
+
+
+def increment_gauge(name: str, value: float = 1, **labels: str) -> None:
+    metric_key = get_metric_key(name, labels)
+    with THREAD_LOCK:
+        METRIC_GAUGES[metric_key] = METRIC_GAUGES.get(metric_key, 0) + value
+
+
+def get_gauge(name: str, **labels: str) -> float:
+    return METRIC_GAUGES.get(get_metric_key(name, labels), 0)
+
+
+def observe_histogram(name: str, value: float, **labels: str) -> None:
+    metric_key = get_metric_key(name, labels)
+    with THREAD_LOCK:
+        if metric_key not in METRIC_HISTOGRAMS:
+            METRIC_HISTOGRAMS[metric_key] = deque(maxlen=METRIC_HISTOGRAM_SIZE)
+        METRIC_HISTOGRAMS[metric_key].append(value)
+        count, total = METRIC_HISTOGRAM_TOTALS.get(metric_key, (0, 0.0))
+        METRIC_HISTOGRAM_TOTALS[metric_key] = (count + 1, total + value)
+
+
+def get_quantiles(samples: Iterable[float]) -> Dict[float, float]:
+    sorted_samples = sorted(samples)
+    if not sorted_samples:
+        return {quantile: 0.0 for quantile in METRIC_QUANTILES}
+    return {quantile: sorted_samples[min(len(sorted_samples) - 1, int(quantile * len(sorted_samples)))] for quantile in METRIC_QUANTILES}
+
+
+def sample_memory_usage() -> float:
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def sample_metrics() -> None:
+    set_gauge('memory_rss_bytes', sample_memory_usage())
+    set_gauge('uptime_seconds', time.time() - START_TIME)
+    torch = sys.modules.get('torch')
+    if torch and torch.cuda.is_available():
+        set_gauge('gpu_memory_reserved_bytes', torch.cuda.memory_reserved())
+
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    with THREAD_LOCK:
+        counters = dict(METRIC_COUNTERS)
+        gauges = dict(METRIC_GAUGES)
+        histograms = {metric_key: list(samples) for metric_key, samples in METRIC_HISTOGRAMS.items()}
+        histogram_totals = dict(METRIC_HISTOGRAM_TOTALS)
+    return {
+        'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters.items()],
+        'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in gauges.items()],
+        'histograms': [{
+            'name': name,
+            'labels': dict(labels),
+            'count': histogram_totals[(name, labels)][0],
+            'sum': histogram_totals[(name, labels)][1],
+            'quantiles': {str(quantile): value for quantile, value in get_quantiles(samples).items()}
+        } for (name, labels), samples in histograms.items()]
+    }
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if labels:
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+    return ''
+
+
+def format_prometheus(metrics_snapshot: Dict[str, Any]) -> str:
+    lines = []
+    for counter in metrics_snapshot['counters']:
+        lines.append(f'roop_{counter["name"]}{format_labels(counter["labels"])} {counter["value"]}')
+    for gauge in metrics_snapshot['gauges']:
+        lines.append(f'roop_{gauge["name"]}{format_labels(gauge["labels"])} {gauge["value"]}')
+    for histogram in metrics_snapshot['histograms']:
+        for quantile, value in histogram['quantiles'].items():
+            lines.append(f'roop_{histogram["name"]}{format_labels({**histogram["labels"], "quantile": quantile})} {value}')
+        lines.append(f'roop_{histogram["name"]}_count{format_labels(histogram["labels"])} {histogram["count"]}')
+        lines.append(f'roop_{histogram["name"]}_sum{format_labels(histogram["labels"])} {histogram["sum"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(environ: Dict[str, Any], start_response: Callable[..., Any]) -> List[bytes]:
+    if environ.get('PATH_INFO') == '/metrics.json':
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [json.dumps(get_metrics_snapshot()).encode()]
+    start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4')])
+    return [format_prometheus(get_metrics_snapshot()).encode()]
+
+
+def write_metrics() -> None:
+    if roop.globals.metrics_path:
+        temp_metrics_path = roop.globals.metrics_path + '.tmp'
+        with open(temp_metrics_path, 'w') as metrics_file:
+            json.dump(get_metrics_snapshot(), metrics_file)
+        os.replace(temp_metrics_path, roop.globals.metrics_path)
+
+
+def run_metrics_sampler() -> None:
+    while True:
+        sample_metrics()
+        write_metrics()
+        time.sleep(METRIC_SAMPLE_INTERVAL)
+
+
+def start_metrics(port: Optional[int] = None) -> bool:
+    is_served = True
+    with THREAD_LOCK:
+        if METRIC_THREADS:
+            return is_served
+        METRIC_THREADS.append(threading.Thread(target=run_metrics_sampler, name='metrics-sampler', daemon=True))
+        if port:
+            handler_class = type('MetricsRequestHandler', (WSGIRequestHandler,), {'log_message': lambda *args: None})
+            try:
+                metrics_server = make_server('127.0.0.1', port, serve_metrics, handler_class=handler_class)
+                METRIC_THREADS.append(threading.Thread(target=metrics_server.serve_forever, name='metrics-server', daemon=True))
+            except OSError:
+                is_served = False
+    sample_metrics()
+    for metric_thread in METRIC_THREADS:
+        metric_thread.start()
+    return is_served
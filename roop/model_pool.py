@@ -0,0 +1,86 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+from roop.memory_profiler import record_memory
+from roop.metrics import increment_gauge
+from roop.thread_budget import get_thread_budget
+from roop.tracer import trace_span
+
+MODEL_POOLS: Dict[str, List[Any]] = {}
+MODEL_REPLICA_TOTALS: Dict[str, int] = {}
+THREAD_LOCK = threading.Lock()
+THREAD_CONDITION = threading.Condition(THREAD_LOCK)
+
+
+def has_model_slot(model_name: str) -> bool:
+    return bool(MODEL_POOLS.setdefault(model_name, [])) or MODEL_REPLICA_TOTALS.get(model_name, 0) < get_thread_budget().execution_replicas
+
+
+@contextmanager
+def checkout_model(model_name: str, create_model: Callable[[], Any]) -> Iterator[Any]:
+    with THREAD_CONDITION:
+        if not has_model_slot(model_name):
+            increment_gauge('model_pool_waiting', model=model_name)
+            with trace_span('model_pool.wait', model=model_name):
+                THREAD_CONDITION.wait_for(lambda: has_model_slot(model_name))
+            increment_gauge('model_pool_waiting', -1, model=model_name)
+        model_pool = MODEL_POOLS[model_name]
+        can_create = not model_pool
+        if can_create:
+            MODEL_REPLICA_TOTALS[model_name] = MODEL_REPLICA_TOTALS.get(model_name, 0) + 1
+        else:
+            model = model_pool.pop(0)
+            if get_thread_budget().shared_replicas:
+                model_pool.append(model)
+    if can_create:
+        model = create_model_replica(model_name, create_model)
+        if get_thread_budget().shared_replicas:
+            release_model(model_pool, model)
+    if get_thread_budget().shared_replicas:
+        yield model
+        return
+    try:
+        yield model
+    finally:
+        release_model(model_pool, model)
+
+
+def create_model_replica(model_name: str, create_model: Callable[[], Any]) -> Any:
+    try:
+        with trace_span('model_pool.create', model=model_name):
+            model = create_model()
+        record_memory(f'model_loaded:{model_name}')
+        return model
+    except Exception:
+        with THREAD_CONDITION:
+            MODEL_REPLICA_TOTALS[model_name] -= 1
+            THREAD_CONDITION.notify_all()
+        raise
+
+
+def release_model(model_pool: List[Any], model: Any) -> None:
+    with THREAD_CONDITION:
+        model_pool.append(model)
+        THREAD_CONDITION.notify_all()
+
+
+def clear_model_pool(model_name: str) -> None:
+    with THREAD_CONDITION:
+        MODEL_POOLS.pop(model_name, None)
+        MODEL_REPLICA_TOTALS.pop(model_name, None)
+        THREAD_CONDITION.notify_all()
+
+
+def warm_up_model(model_name: str, create_model: Callable[[], Any], warm_up: Callable[[Any], None]) -> None:
+    while True:
+        with THREAD_CONDITION:
+            model_pool = MODEL_POOLS.setdefault(model_name, [])
+            if MODEL_REPLICA_TOTALS.get(model_name, 0) >= get_thread_budget().execution_replicas:
+                return
+            MODEL_REPLICA_TOTALS[model_name] = MODEL_REPLICA_TOTALS.get(model_name, 0) + 1
+        model = create_model_replica(model_name, create_model)
+        try:
+            warm_up(model)
+        finally:
+            release_model(model_pool, model)
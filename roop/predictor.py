@@ -1,9 +1,9 @@
 import threading
+from typing import Any
 import numpy
-import opennsfw2
 from PIL import Image
-from keras import Model
 
+import roop.globals
 from roop.typing import Frame
 
 PREDICTOR = None
@@ -11,11 +11,13 @@ THREAD_LOCK = threading.Lock()
 MAX_PROBABILITY = 0.85
 
 
-def get_predictor() -> Model:
+def get_predictor() -> Any:
     global PREDICTOR
 
     with THREAD_LOCK:
         if PREDICTOR is None:
+            import opennsfw2
+            limit_predictor_resources()
             PREDICTOR = opennsfw2.make_open_nsfw_model()
     return PREDICTOR
 
@@ -26,7 +28,24 @@ def clear_predictor() -> None:
     PREDICTOR = None
 
 
+def limit_predictor_resources() -> None:
+    import tensorflow
+    # prevent tensorflow memory leak
+    gpus = tensorflow.config.experimental.list_physical_devices('GPU')
+    for gpu in gpus:
+        # Increase memory limit for CUDA if available
+        # Tesla T4 has 15GB VRAM, use 12GB to leave room for system
+        memory_limit = 12288 if 'CUDAExecutionProvider' in roop.globals.execution_providers else 12288
+        try:
+            tensorflow.config.experimental.set_virtual_device_configuration(gpu, [
+                tensorflow.config.experimental.VirtualDeviceConfiguration(memory_limit=memory_limit)
+            ])
+        except RuntimeError:
+            pass
+
+
 def predict_frame(target_frame: Frame) -> bool:
+    import opennsfw2
     image = Image.fromarray(target_frame)
     image = opennsfw2.preprocess_image(image, opennsfw2.Preprocessing.YAHOO)
     views = numpy.expand_dims(image, axis=0)
@@ -35,9 +54,13 @@ def predict_frame(target_frame: Frame) -> bool:
 
 
 def predict_image(target_path: str) -> bool:
+    import opennsfw2
+    limit_predictor_resources()
     return opennsfw2.predict_image(target_path) > MAX_PROBABILITY
 
 
 def predict_video(target_path: str) -> bool:
+    import opennsfw2
+    limit_predictor_resources()
     _, probabilities = opennsfw2.predict_video_frames(video_path=target_path, frame_interval=100)
     return any(probability > MAX_PROBABILITY for probability in probabilities)
@@ -0,0 +1,124 @@
+import bisect
+import json
+import os
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from roop.tracer import trace_span
+from roop.typing import MediaInfo
+
+MEDIA_INFOS: Dict[Tuple[str, int, int], MediaInfo] = {}
+MEDIA_KEYFRAMES: Dict[Tuple[str, int, int], List[int]] = {}
+THREAD_LOCK = threading.Lock()
+
+
+def get_media_key(media_path: str) -> Optional[Tuple[str, int, int]]:
+    if not media_path or not os.path.isfile(media_path):
+        return None
+    media_stat = os.stat(media_path)
+    return os.path.abspath(media_path), media_stat.st_mtime_ns, media_stat.st_size
+
+
+def get_media_info(media_path: str) -> Optional[MediaInfo]:
+    media_key = get_media_key(media_path)
+    if media_key is None:
+        return None
+    with THREAD_LOCK:
+        if media_key in MEDIA_INFOS:
+            return MEDIA_INFOS[media_key]
+    media_info = probe_media(media_path)
+    if media_info is None:
+        return None
+    with THREAD_LOCK:
+        return MEDIA_INFOS.setdefault(media_key, media_info)
+
+
+def get_media_keyframes(media_path: str) -> List[int]:
+    media_key = get_media_key(media_path)
+    if media_key is None:
+        return []
+    with THREAD_LOCK:
+        if media_key in MEDIA_KEYFRAMES:
+            return MEDIA_KEYFRAMES[media_key]
+    keyframes = probe_keyframes(media_path)
+    if not keyframes:
+        return []
+    with THREAD_LOCK:
+        return MEDIA_KEYFRAMES.setdefault(media_key, keyframes)
+
+
+def clear_media_infos() -> None:
+    with THREAD_LOCK:
+        MEDIA_INFOS.clear()
+        MEDIA_KEYFRAMES.clear()
+
+
+def run_ffprobe(args: List[str]) -> Optional[Dict[str, Any]]:
+    commands = ['ffprobe', '-v', 'error', '-of', 'json']
+    commands.extend(args)
+    try:
+        with trace_span('ffprobe.run', arguments=' '.join(args)):
+            return json.loads(subprocess.check_output(commands, stderr=subprocess.DEVNULL))
+    except Exception:
+        pass
+    return None
+
+
+def probe_media(media_path: str) -> Optional[MediaInfo]:
+    output = run_ffprobe(['-show_entries', 'stream=codec_type,width,height,r_frame_rate,nb_frames,duration:format=duration', media_path])
+    if not output:
+        return None
+    streams = output.get('streams', [])
+    video_streams = [stream for stream in streams if stream.get('codec_type') == 'video']
+    if not video_streams:
+        return None
+    video_stream = video_streams[0]
+    fps = parse_frame_rate(video_stream.get('r_frame_rate'))
+    return MediaInfo(
+        fps=fps,
+        frame_total=get_frame_total(video_stream, output.get('format', {}), fps),
+        width=int(video_stream.get('width', 0)),
+        height=int(video_stream.get('height', 0)),
+        audio_streams=len([stream for stream in streams if stream.get('codec_type') == 'audio'])
+    )
+
+
+def probe_keyframes(media_path: str) -> List[int]:
+    output = run_ffprobe(['-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', media_path])
+    if not output or not output.get('packets'):
+        return []
+    return get_keyframes(output['packets'])
+
+
+def get_frame_total(video_stream: Dict[str, Any], media_format: Dict[str, Any], fps: float) -> int:
+    if str(video_stream.get('nb_frames', '')).isdigit():
+        return int(video_stream['nb_frames'])
+    for duration in [video_stream.get('duration'), media_format.get('duration')]:
+        if is_float(duration):
+            return round(float(duration) * fps)
+    return 0
+
+
+def parse_frame_rate(frame_rate: Optional[str]) -> float:
+    try:
+        numerator, denominator = map(int, frame_rate.split('/'))
+        return numerator / denominator
+    except Exception:
+        pass
+    return 30
+
+
+def get_keyframes(video_packets: List[Dict[str, Any]]) -> List[int]:
+    presentation_times = sorted(float(packet['pts_time']) for packet in video_packets if is_float(packet.get('pts_time')))
+    keyframe_times = [float(packet['pts_time']) for packet in video_packets if 'K' in packet.get('flags', '') and is_float(packet.get('pts_time'))]
+    keyframes = sorted({bisect.bisect_left(presentation_times, keyframe_time) for keyframe_time in keyframe_times})
+    return keyframes or [0]
+
+
+def is_float(value: Any) -> bool:
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
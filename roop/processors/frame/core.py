@@ -1,14 +1,17 @@
-import os
 import sys
 import importlib
-import psutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from queue import Queue
 from types import ModuleType
 from typing import Any, List, Callable
 from tqdm import tqdm
 
 import roop
+from roop.thread_budget import get_thread_budget, format_thread_budget
+from roop.memory_profiler import record_frame_memory
+from roop.metrics import get_gauge, increment_counter, increment_gauge, sample_memory_usage
+from roop.tracer import add_trace_event, trace_span
 
 FRAME_PROCESSORS_MODULES: List[ModuleType] = []
 FRAME_PROCESSORS_INTERFACE = [
@@ -45,18 +48,38 @@ def get_frame_processors_modules(frame_processors: List[str]) -> List[ModuleType
     return FRAME_PROCESSORS_MODULES
 
 
+def warm_up_frame_processors(frame_processors: List[str]) -> List[Future[None]]:
+    import roop.face_analyser as face_analyser
+    executor = ThreadPoolExecutor(max_workers=len(frame_processors) + 1)
+    futures = [executor.submit(face_analyser.warm_up_face_analyser)]
+    futures += [executor.submit(frame_processor_module.warm_up) for frame_processor_module in get_frame_processors_modules(frame_processors) if hasattr(frame_processor_module, 'warm_up')]
+    executor.shutdown(wait=False)
+    return futures
+
+
 def multi_process_frame(source_path: str, temp_frame_paths: List[str], process_frames: Callable[[str, List[str], Any], None], update: Callable[[], None]) -> None:
     with ThreadPoolExecutor(max_workers=roop.globals.execution_threads) as executor:
         futures = []
         queue = create_queue(temp_frame_paths)
-        queue_per_future = max(len(temp_frame_paths) // roop.globals.execution_threads, 1)
+        queue_per_future = roop.globals.execution_batch_size or max(len(temp_frame_paths) // roop.globals.execution_threads, 1)
+        if roop.globals.face_detector_roi:
+            queue_per_future = max(queue_per_future, roop.globals.face_detector_sweep_interval or 1)
         while not queue.empty():
-            future = executor.submit(process_frames, source_path, pick_queue(queue, queue_per_future), update)
+            increment_gauge('queue_depth')
+            future = executor.submit(process_queued_frames, process_frames, source_path, pick_queue(queue, queue_per_future), update, time.perf_counter())
             futures.append(future)
         for future in as_completed(futures):
             future.result()
 
 
+def process_queued_frames(process_frames: Callable[[str, List[str], Any], None], source_path: str, temp_frame_paths: List[str], update: Callable[[], None], submit_time: float) -> None:
+    increment_gauge('queue_depth', -1)
+    if roop.globals.trace_path:
+        add_trace_event('queue.wait', submit_time, time.perf_counter(), {'frames': len(temp_frame_paths)})
+    with trace_span(process_frames.__module__.split('.')[-1] + '.process_frames', frames=len(temp_frame_paths)):
+        process_frames(source_path, temp_frame_paths, update)
+
+
 def create_queue(temp_frame_paths: List[str]) -> Queue[str]:
     queue: Queue[str] = Queue()
     for frame_path in temp_frame_paths:
@@ -80,12 +103,14 @@ def process_video(source_path: str, frame_paths: list[str], process_frames: Call
 
 
 def update_progress(progress: Any = None) -> None:
-    process = psutil.Process(os.getpid())
-    memory_usage = process.memory_info().rss / 1024 / 1024 / 1024
+    increment_counter('frames_processed_total')
+    record_frame_memory()
+    memory_usage = (get_gauge('memory_rss_bytes') or sample_memory_usage()) / 1024 / 1024 / 1024
     progress.set_postfix({
         'memory_usage': '{:.2f}'.format(memory_usage).zfill(5) + 'GB',
         'execution_providers': roop.globals.execution_providers,
-        'execution_threads': roop.globals.execution_threads
+        'execution_threads': roop.globals.execution_threads,
+        'thread_budget': format_thread_budget(get_thread_budget())
     })
     progress.refresh()
     progress.update(1)
@@ -1,30 +1,54 @@
-from typing import Any, List, Callable
+from typing import Any, ContextManager, List, Callable
 import cv2
-import threading
-from gfpgan.utils import GFPGANer
+import numpy
+import torch
+from basicsr.utils import img2tensor, tensor2img
+from facexlib.parsing.parsenet import ParseNet
+from gfpgan.archs.gfpganv1_clean_arch import GFPGANv1Clean
+from torchvision.transforms.functional import normalize
 
 import roop.globals
 import roop.processors.frame.core
 from roop.core import update_status
-from roop.face_analyser import get_many_faces
+from roop.face_analyser import get_many_faces, track_faces
+from roop.face_helper import FFHQ_TEMPLATE, warp_face, paste_back
+from roop.model_pool import checkout_model, clear_model_pool, warm_up_model
+from roop.thread_budget import get_thread_budget
+from roop.tracer import trace_span
 from roop.typing import Frame, Face
-from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video
+from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video, get_temp_frame_number
 
-FACE_ENHANCER = None
-THREAD_SEMAPHORE = threading.Semaphore()
-THREAD_LOCK = threading.Lock()
 NAME = 'ROOP.FACE-ENHANCER'
+FACE_ANALYSER_MODULES = ['detection']
+FACE_PARSER_NAME = 'ROOP.FACE-PARSER'
+FACE_PARSER_MASK = numpy.array([0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 0, 0, 0], dtype=numpy.float32)
+FACE_PARSER_MASK_BORDER = 10
 
 
-def get_face_enhancer() -> Any:
-    global FACE_ENHANCER
+def get_face_enhancer() -> ContextManager[Any]:
+    return checkout_model(NAME, create_face_enhancer)
 
-    with THREAD_LOCK:
-        if FACE_ENHANCER is None:
-            model_path = resolve_relative_path('../models/GFPGANv1.4.pth')
-            # todo: set models path -> https://github.com/TencentARC/GFPGAN/issues/399
-            FACE_ENHANCER = GFPGANer(model_path=model_path, upscale=1, device=get_device())
-    return FACE_ENHANCER
+
+def create_face_enhancer() -> Any:
+    model_path = resolve_relative_path('../models/GFPGANv1.4.pth')
+    torch.set_num_threads(get_thread_budget().torch_threads)
+    model_state = torch.load(model_path, map_location='cpu')
+    face_enhancer = GFPGANv1Clean(out_size=512, num_style_feat=512, channel_multiplier=2, decoder_load_path=None, fix_decoder=False, num_mlp=8, input_is_latent=True, different_w=True, narrow=1, sft_half=True)
+    face_enhancer.load_state_dict(model_state['params_ema'] if 'params_ema' in model_state else model_state['params'], strict=True)
+    face_enhancer.eval()
+    return face_enhancer.to(get_device())
+
+
+def get_face_parser() -> ContextManager[Any]:
+    return checkout_model(FACE_PARSER_NAME, create_face_parser)
+
+
+def create_face_parser() -> Any:
+    model_path = resolve_relative_path('../models/parsing_parsenet.pth')
+    face_parser = ParseNet(in_size=512, out_size=512, parsing_ch=19)
+    face_parser.load_state_dict(torch.load(model_path, map_location='cpu'), strict=True)
+    face_parser.eval()
+    return face_parser.to(get_device())
 
 
 def get_device() -> str:
@@ -36,14 +60,28 @@ def get_device() -> str:
 
 
 def clear_face_enhancer() -> None:
-    global FACE_ENHANCER
+    clear_model_pool(NAME)
+    clear_model_pool(FACE_PARSER_NAME)
+
+
+def warm_up() -> None:
+    warm_up_model(NAME, create_face_enhancer, warm_up_face_enhancer)
+    warm_up_model(FACE_PARSER_NAME, create_face_parser, warm_up_face_parser)
+
+
+def warm_up_face_enhancer(face_enhancer: Any) -> None:
+    with torch.no_grad():
+        face_enhancer(torch.zeros((1, 3, 512, 512), device=get_device()), return_rgb=False, weight=0.5)
 
-    FACE_ENHANCER = None
+
+def warm_up_face_parser(face_parser: Any) -> None:
+    with torch.no_grad():
+        face_parser(torch.zeros((1, 3, 512, 512), device=get_device()))
 
 
 def pre_check() -> bool:
     download_directory_path = resolve_relative_path('../models')
-    conditional_download(download_directory_path, ['https://github.com/TencentARC/GFPGAN/releases/download/v1.3.4/GFPGANv1.4.pth'])
+    conditional_download(download_directory_path, ['https://github.com/TencentARC/GFPGAN/releases/download/v1.3.4/GFPGANv1.4.pth', 'https://github.com/xinntao/facexlib/releases/download/v0.2.2/parsing_parsenet.pth'])
     return True
 
 
@@ -59,37 +97,56 @@ def post_process() -> None:
 
 
 def enhance_face(target_face: Face, temp_frame: Frame) -> Frame:
-    start_x, start_y, end_x, end_y = map(int, target_face['bbox'])
-    padding_x = int((end_x - start_x) * 0.5)
-    padding_y = int((end_y - start_y) * 0.5)
-    start_x = max(0, start_x - padding_x)
-    start_y = max(0, start_y - padding_y)
-    end_x = max(0, end_x + padding_x)
-    end_y = max(0, end_y + padding_y)
-    temp_face = temp_frame[start_y:end_y, start_x:end_x]
-    if temp_face.size:
-        with THREAD_SEMAPHORE:
-            _, _, temp_face = get_face_enhancer().enhance(
-                temp_face,
-                paste_back=True
-            )
-        temp_frame[start_y:end_y, start_x:end_x] = temp_face
-    return temp_frame
+    crop_frame, affine_matrix = warp_face(temp_frame, target_face.kps, FFHQ_TEMPLATE, (512, 512))
+    crop_frame = restore_face(crop_frame)
+    return paste_back(temp_frame, crop_frame, affine_matrix, create_parse_mask(crop_frame))
+
+
+def create_crop_tensor(crop_frame: Frame) -> Any:
+    crop_tensor = img2tensor(crop_frame / 255.0, bgr2rgb=True, float32=True)
+    normalize(crop_tensor, (0.5, 0.5, 0.5), (0.5, 0.5, 0.5), inplace=True)
+    return crop_tensor.unsqueeze(0).to(get_device())
+
+
+def create_parse_mask(crop_frame: Frame) -> Frame:
+    crop_tensor = create_crop_tensor(crop_frame)
+    with get_face_parser() as face_parser, torch.no_grad(), trace_span('face_enhancer.parsenet'):
+        face_parsing = face_parser(crop_tensor)[0].argmax(dim=1).squeeze().cpu().numpy()
+    parse_mask = FACE_PARSER_MASK[face_parsing]
+    parse_mask = cv2.GaussianBlur(parse_mask, (101, 101), 11)
+    parse_mask = cv2.GaussianBlur(parse_mask, (101, 101), 11)
+    parse_mask[:FACE_PARSER_MASK_BORDER, :] = 0
+    parse_mask[-FACE_PARSER_MASK_BORDER:, :] = 0
+    parse_mask[:, :FACE_PARSER_MASK_BORDER] = 0
+    parse_mask[:, -FACE_PARSER_MASK_BORDER:] = 0
+    return parse_mask
+
+
+def restore_face(crop_frame: Frame) -> Frame:
+    crop_tensor = create_crop_tensor(crop_frame)
+    with get_face_enhancer() as face_enhancer, torch.no_grad(), trace_span('face_enhancer.gfpgan'):
+        crop_tensor = face_enhancer(crop_tensor, return_rgb=False, weight=0.5)[0]
+    return tensor2img(crop_tensor.squeeze(0), rgb2bgr=True, min_max=(-1, 1)).astype('uint8')
 
 
 def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
-    many_faces = get_many_faces(temp_frame)
-    if many_faces:
-        for target_face in many_faces:
-            temp_frame = enhance_face(target_face, temp_frame)
+    with trace_span('face_enhancer.process_frame') as span:
+        many_faces = get_many_faces(temp_frame)
+        if many_faces:
+            for target_face in many_faces:
+                temp_frame = enhance_face(target_face, temp_frame)
+        span['faces'] = len(many_faces or [])
     return temp_frame
 
 
 def process_frames(source_path: str, temp_frame_paths: List[str], update: Callable[[], None]) -> None:
     for temp_frame_path in temp_frame_paths:
-        temp_frame = cv2.imread(temp_frame_path)
-        result = process_frame(None, None, temp_frame)
-        cv2.imwrite(temp_frame_path, result)
+        with trace_span('frame.read'):
+            temp_frame = cv2.imread(temp_frame_path)
+        with track_faces(get_temp_frame_number(temp_frame_path)):
+            result = process_frame(None, None, temp_frame)
+        with trace_span('frame.write'):
+            cv2.imwrite(temp_frame_path, result)
         if update:
             update()
 
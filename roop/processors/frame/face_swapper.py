@@ -1,43 +1,37 @@
-from typing import Any, List, Callable
+from typing import Any, ContextManager, Dict, List, Callable
 import cv2
-import insightface
-import threading
-import onnxruntime
 
 import roop.globals
 import roop.processors.frame.core
 from roop.core import update_status
-from roop.face_analyser import get_one_face, get_many_faces, find_similar_face
-from roop.face_reference import get_face_reference, set_face_reference, clear_face_reference
+from roop.face_analyser import get_one_face, get_many_faces, analyse_source_face, find_similar_face, track_faces
+from roop.face_helper import paste_back
+from roop.face_reference import get_face_reference, set_face_reference, clear_face_reference, get_scene_index, set_scene_face_reference
+from roop.model_pool import checkout_model, clear_model_pool, warm_up_model
+from roop.session import load_model, warm_up_session
+from roop.tracer import trace_span
 from roop.typing import Face, Frame
-from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video
+from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video, get_temp_frame_paths, get_temp_frame_number
 
-FACE_SWAPPER = None
-THREAD_LOCK = threading.Lock()
 NAME = 'ROOP.FACE-SWAPPER'
+FACE_ANALYSER_MODULES = ['detection', 'recognition']
+SCENE_REFERENCE_SAMPLE_TOTAL = 5
 
 
-def get_face_swapper() -> Any:
-    global FACE_SWAPPER
+def get_face_swapper() -> ContextManager[Any]:
+    return checkout_model(NAME, create_face_swapper)
 
-    with THREAD_LOCK:
-        if FACE_SWAPPER is None:
-            model_path = resolve_relative_path('../models/inswapper_128.onnx')
-            # Forzar uso de CUDA si está disponible
-            providers = roop.globals.execution_providers
-            if 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
-                # Asegurar que CUDA esté primero en la lista
-                providers = ['CUDAExecutionProvider'] + [p for p in providers if p != 'CUDAExecutionProvider']
-                print(f"[FACE_SWAPPER] Usando providers: {providers}")
-            
-            FACE_SWAPPER = insightface.model_zoo.get_model(model_path, providers=providers)
-    return FACE_SWAPPER
+
+def create_face_swapper() -> Any:
+    return load_model(resolve_relative_path('../models/inswapper_128.onnx'))
 
 
 def clear_face_swapper() -> None:
-    global FACE_SWAPPER
+    clear_model_pool(NAME)
+
 
-    FACE_SWAPPER = None
+def warm_up() -> None:
+    warm_up_model(NAME, create_face_swapper, lambda face_swapper: warm_up_session(face_swapper.session))
 
 
 def pre_check() -> bool:
@@ -65,35 +59,49 @@ def post_process() -> None:
 
 
 def swap_face(source_face: Face, target_face: Face, temp_frame: Frame) -> Frame:
-    return get_face_swapper().get(temp_frame, target_face, source_face, paste_back=True)
+    return swap_faces(source_face, [target_face], temp_frame)
+
+
+def swap_faces(source_face: Face, target_faces: List[Face], temp_frame: Frame) -> Frame:
+    with get_face_swapper() as face_swapper, trace_span('face_swapper.inswapper', faces=len(target_faces)):
+        crop_frames = [face_swapper.get(temp_frame, target_face, source_face, paste_back=False) for target_face in target_faces]
+    with trace_span('face_swapper.paste_back', faces=len(crop_frames)):
+        for crop_frame, affine_matrix in crop_frames:
+            temp_frame = paste_back(temp_frame, crop_frame, affine_matrix)
+    return temp_frame
 
 
 def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
-    if roop.globals.many_faces:
-        many_faces = get_many_faces(temp_frame)
-        if many_faces:
-            for target_face in many_faces:
+    with trace_span('face_swapper.process_frame') as span:
+        if roop.globals.many_faces:
+            many_faces = get_many_faces(temp_frame)
+            if many_faces:
+                temp_frame = swap_faces(source_face, many_faces, temp_frame)
+            span['faces'] = len(many_faces or [])
+        else:
+            target_face = find_similar_face(temp_frame, reference_face)
+            if target_face:
                 temp_frame = swap_face(source_face, target_face, temp_frame)
-    else:
-        target_face = find_similar_face(temp_frame, reference_face)
-        if target_face:
-            temp_frame = swap_face(source_face, target_face, temp_frame)
+            span['faces'] = int(target_face is not None)
     return temp_frame
 
 
 def process_frames(source_path: str, temp_frame_paths: List[str], update: Callable[[], None]) -> None:
-    source_face = get_one_face(cv2.imread(source_path))
-    reference_face = None if roop.globals.many_faces else get_face_reference()
+    source_face = analyse_source_face(cv2.imread(source_path))
     for temp_frame_path in temp_frame_paths:
-        temp_frame = cv2.imread(temp_frame_path)
-        result = process_frame(source_face, reference_face, temp_frame)
-        cv2.imwrite(temp_frame_path, result)
+        reference_face = None if roop.globals.many_faces else get_face_reference(get_temp_frame_number(temp_frame_path))
+        with trace_span('frame.read'):
+            temp_frame = cv2.imread(temp_frame_path)
+        with track_faces(get_temp_frame_number(temp_frame_path)):
+            result = process_frame(source_face, reference_face, temp_frame)
+        with trace_span('frame.write'):
+            cv2.imwrite(temp_frame_path, result)
         if update:
             update()
 
 
 def process_image(source_path: str, target_path: str, output_path: str) -> None:
-    source_face = get_one_face(cv2.imread(source_path))
+    source_face = analyse_source_face(cv2.imread(source_path))
     target_frame = cv2.imread(target_path)
     reference_face = None if roop.globals.many_faces else get_one_face(target_frame, roop.globals.reference_face_position)
     result = process_frame(source_face, reference_face, target_frame)
@@ -102,7 +110,21 @@ def process_image(source_path: str, target_path: str, output_path: str) -> None:
 
 def process_video(source_path: str, temp_frame_paths: List[str]) -> None:
     if not roop.globals.many_faces and not get_face_reference():
-        reference_frame = cv2.imread(temp_frame_paths[roop.globals.reference_frame_number])
+        reference_frame = cv2.imread(get_temp_frame_paths(roop.globals.target_path)[roop.globals.reference_frame_number])
         reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
         set_face_reference(reference_face)
+    if not roop.globals.many_faces and roop.globals.reference_per_scene and get_face_reference():
+        refresh_scene_face_references(temp_frame_paths)
     roop.processors.frame.core.process_video(source_path, temp_frame_paths, process_frames)
+
+
+def refresh_scene_face_references(temp_frame_paths: List[str]) -> None:
+    scene_frame_paths: Dict[int, List[str]] = {}
+    for temp_frame_path in sorted(temp_frame_paths, key=get_temp_frame_number):
+        scene_frame_paths.setdefault(get_scene_index(get_temp_frame_number(temp_frame_path)), []).append(temp_frame_path)
+    for scene_index, frame_paths in scene_frame_paths.items():
+        for frame_path in frame_paths[::max(1, len(frame_paths) // SCENE_REFERENCE_SAMPLE_TOTAL)][:SCENE_REFERENCE_SAMPLE_TOTAL]:
+            scene_face = find_similar_face(cv2.imread(frame_path), get_face_reference())
+            if scene_face:
+                set_scene_face_reference(scene_index, scene_face)
+                break
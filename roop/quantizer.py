@@ -0,0 +1,181 @@
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+import cv2
+import numpy
+from insightface.utils.face_align import norm_crop, norm_crop2
+from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+from roop.capturer import get_video_frame, get_video_frame_total, clear_video_captures
+from roop.face_analyser import get_face_analyser_model_path, get_embedding_version, embed_source_face
+from roop.session import get_quantized_model_path, load_model
+from roop.typing import Face, Frame
+from roop.utilities import resolve_relative_path, is_image, is_video
+
+QUANTIZATION_MODELS = ['detection', 'recognition', 'face_swapper']
+DETECTION_SIZE = (640, 640)
+
+
+def get_quantization_model_paths() -> Dict[str, str]:
+    return {
+        'detection': get_face_analyser_model_path('detection'),
+        'recognition': get_face_analyser_model_path('recognition'),
+        'face_swapper': resolve_relative_path('../models/inswapper_128.onnx')
+    }
+
+
+def load_quantization_models(model_precision: str) -> Dict[str, Any]:
+    quantization_models = {}
+    for model_name, model_path in get_quantization_model_paths().items():
+        quantization_models[model_name] = load_model(model_path, model_precision)
+    quantization_models['detection'].prepare(ctx_id=0, input_size=DETECTION_SIZE, det_thresh=0.5)
+    quantization_models['recognition'].prepare(ctx_id=0)
+    return quantization_models
+
+
+def get_calibration_paths(paths: List[str]) -> List[str]:
+    calibration_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            calibration_paths.extend(sorted(os.path.join(path, file_name) for file_name in os.listdir(path)))
+        else:
+            calibration_paths.append(path)
+    return [calibration_path for calibration_path in calibration_paths if is_image(calibration_path) or is_video(calibration_path)]
+
+
+def load_calibration_frames(paths: List[str], frame_total: int) -> List[Frame]:
+    calibration_paths = get_calibration_paths(paths)
+    calibration_frames = []
+    for calibration_path in calibration_paths:
+        if is_image(calibration_path):
+            calibration_frames.append(cv2.imread(calibration_path))
+        else:
+            video_frame_total = get_video_frame_total(calibration_path)
+            sample_total = max(1, frame_total // len(calibration_paths))
+            for index in range(sample_total):
+                calibration_frame = get_video_frame(calibration_path, 1 + video_frame_total * index // sample_total)
+                if calibration_frame is not None:
+                    calibration_frames.append(calibration_frame)
+            clear_video_captures()
+    return [calibration_frame for calibration_frame in calibration_frames if calibration_frame is not None][:frame_total]
+
+
+def create_calibration_faces(quantization_models: Dict[str, Any], calibration_frames: List[Frame]) -> List[Tuple[Frame, Face]]:
+    calibration_faces = []
+    for calibration_frame in calibration_frames:
+        bboxes, kpss = quantization_models['detection'].detect(calibration_frame, metric='default')
+        for index, bbox in enumerate(bboxes):
+            if kpss is not None:
+                face = Face(bbox=bbox[0:4], kps=kpss[index], det_score=bbox[4])
+                quantization_models['recognition'].get(calibration_frame, face)
+                face.embedding_version = get_embedding_version()
+                calibration_faces.append((calibration_frame, embed_source_face(calibration_frame, face)))
+    return calibration_faces
+
+
+def create_detection_input(detection_model: Any, calibration_frame: Frame) -> Dict[str, Frame]:
+    input_width, input_height = DETECTION_SIZE
+    scale = min(input_width / calibration_frame.shape[1], input_height / calibration_frame.shape[0])
+    resize_width, resize_height = int(calibration_frame.shape[1] * scale), int(calibration_frame.shape[0] * scale)
+    detection_frame = numpy.zeros((input_height, input_width, 3), dtype=numpy.uint8)
+    detection_frame[:resize_height, :resize_width] = cv2.resize(calibration_frame, (resize_width, resize_height))
+    blob = cv2.dnn.blobFromImage(detection_frame, 1.0 / detection_model.input_std, DETECTION_SIZE, (detection_model.input_mean,) * 3, swapRB=True)
+    return {detection_model.input_name: blob}
+
+
+def create_recognition_input(recognition_model: Any, calibration_frame: Frame, face: Face) -> Dict[str, Frame]:
+    crop_frame = norm_crop(calibration_frame, landmark=face.kps, image_size=recognition_model.input_size[0])
+    blob = cv2.dnn.blobFromImages([crop_frame], 1.0 / recognition_model.input_std, recognition_model.input_size, (recognition_model.input_mean,) * 3, swapRB=True)
+    return {recognition_model.input_name: blob}
+
+
+def create_face_swapper_input(face_swapper_model: Any, calibration_frame: Frame, target_face: Face, source_face: Face) -> Dict[str, Frame]:
+    crop_frame, _ = norm_crop2(calibration_frame, target_face.kps, face_swapper_model.input_size[0])
+    blob = cv2.dnn.blobFromImage(crop_frame, 1.0 / face_swapper_model.input_std, face_swapper_model.input_size, (face_swapper_model.input_mean,) * 3, swapRB=True)
+    latent = numpy.dot(source_face.normed_embedding.reshape((1, -1)), face_swapper_model.emap)
+    latent /= numpy.linalg.norm(latent)
+    return {face_swapper_model.input_names[0]: blob, face_swapper_model.input_names[1]: latent.astype(numpy.float32)}
+
+
+def create_calibration_inputs(quantization_models: Dict[str, Any], calibration_frames: List[Frame], calibration_faces: List[Tuple[Frame, Face]]) -> Dict[str, List[Dict[str, Frame]]]:
+    calibration_inputs: Dict[str, List[Dict[str, Frame]]] = {model_name: [] for model_name in QUANTIZATION_MODELS}
+    for calibration_frame in calibration_frames:
+        calibration_inputs['detection'].append(create_detection_input(quantization_models['detection'], calibration_frame))
+    for index, (calibration_frame, face) in enumerate(calibration_faces):
+        _, source_face = calibration_faces[(index + 1) % len(calibration_faces)]
+        calibration_inputs['recognition'].append(create_recognition_input(quantization_models['recognition'], calibration_frame, face))
+        calibration_inputs['face_swapper'].append(create_face_swapper_input(quantization_models['face_swapper'], calibration_frame, face, source_face))
+    return calibration_inputs
+
+
+def quantize_model(model_path: str, calibration_inputs: List[Dict[str, Frame]], quantization_method: str) -> str:
+    quantized_model_path = get_quantized_model_path(model_path, 'int8')
+    os.makedirs(os.path.dirname(quantized_model_path), exist_ok=True)
+    if quantization_method == 'dynamic' or not calibration_inputs:
+        quantize_dynamic(model_path, quantized_model_path, weight_type=QuantType.QInt8)
+    else:
+        calibration_iterator = iter(calibration_inputs)
+        calibration_reader = SimpleNamespace(get_next=lambda: next(calibration_iterator, None))
+        quantize_static(model_path, quantized_model_path, calibration_reader, quant_format=QuantFormat.QDQ, per_channel=True, activation_type=QuantType.QInt8, weight_type=QuantType.QInt8, calibrate_method=CalibrationMethod.MinMax)
+    return quantized_model_path
+
+
+def quantize_models(paths: List[str], frame_total: int, quantization_method: str) -> Dict[str, Dict[str, float]]:
+    quantization_models = load_quantization_models('fp32')
+    calibration_frames = load_calibration_frames(paths, frame_total)
+    calibration_faces = create_calibration_faces(quantization_models, calibration_frames)
+    calibration_inputs = create_calibration_inputs(quantization_models, calibration_frames, calibration_faces)
+    for model_name, model_path in get_quantization_model_paths().items():
+        quantize_model(model_path, calibration_inputs[model_name], quantization_method)
+    return create_quantization_report(quantization_models, load_quantization_models('int8'), calibration_inputs)
+
+
+def run_model(model: Any, model_input: Dict[str, Frame]) -> Tuple[Frame, float]:
+    start_time = time.perf_counter()
+    model_output = model.session.run(None, model_input)[0]
+    return model_output, time.perf_counter() - start_time
+
+
+def get_cosine_drift(fp32_output: Frame, int8_output: Frame) -> float:
+    fp32_embedding, int8_embedding = fp32_output.ravel(), int8_output.ravel()
+    return float(1 - numpy.dot(fp32_embedding, int8_embedding) / max(numpy.linalg.norm(fp32_embedding) * numpy.linalg.norm(int8_embedding), 1e-12))
+
+
+def get_psnr(fp32_output: Frame, int8_output: Frame) -> float:
+    mean_squared_error = float(numpy.mean((numpy.clip(fp32_output, 0, 1) - numpy.clip(int8_output, 0, 1)) ** 2))
+    if mean_squared_error == 0:
+        return 100.0
+    return min(100.0, 10 * numpy.log10(1 / mean_squared_error))
+
+
+def create_quantization_report(fp32_models: Dict[str, Any], int8_models: Dict[str, Any], calibration_inputs: Dict[str, List[Dict[str, Frame]]]) -> Dict[str, Dict[str, float]]:
+    quantization_report = {}
+    for model_name in QUANTIZATION_MODELS:
+        fp32_times, int8_times, scores = [], [], []
+        for model_input in calibration_inputs[model_name]:
+            fp32_output, fp32_time = run_model(fp32_models[model_name], model_input)
+            int8_output, int8_time = run_model(int8_models[model_name], model_input)
+            fp32_times.append(fp32_time)
+            int8_times.append(int8_time)
+            if model_name == 'face_swapper':
+                scores.append(get_psnr(fp32_output, int8_output))
+            else:
+                scores.append(get_cosine_drift(fp32_output, int8_output))
+        if not fp32_times:
+            continue
+        fp32_milliseconds = float(numpy.median(fp32_times)) * 1000
+        int8_milliseconds = float(numpy.median(int8_times)) * 1000
+        quantization_report[model_name] = {
+            'samples': len(fp32_times),
+            'fp32_milliseconds': round(fp32_milliseconds, 2),
+            'int8_milliseconds': round(int8_milliseconds, 2),
+            'speedup': round(fp32_milliseconds / max(int8_milliseconds, 1e-6), 2)
+        }
+        if model_name == 'face_swapper':
+            quantization_report[model_name]['psnr_mean'] = round(float(numpy.mean(scores)), 2)
+            quantization_report[model_name]['psnr_min'] = round(float(numpy.min(scores)), 2)
+        else:
+            quantization_report[model_name]['cosine_drift_mean'] = round(float(numpy.mean(scores)), 5)
+            quantization_report[model_name]['cosine_drift_max'] = round(float(numpy.max(scores)), 5)
+    return quantization_report
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import platform
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy
+import onnxruntime
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.attribute import Attribute
+from insightface.model_zoo.inswapper import INSwapper
+from insightface.model_zoo.landmark import Landmark
+from insightface.model_zoo.retinaface import RetinaFace
+
+import roop.globals
+from roop.thread_budget import get_thread_budget
+from roop.utilities import resolve_relative_path
+
+SESSION_CACHE_DIRECTORY = resolve_relative_path('../models/optimized')
+SESSION_CACHE_EXCLUDED_PROVIDERS = ['TensorrtExecutionProvider', 'OpenVINOExecutionProvider', 'CoreMLExecutionProvider']
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL
+}
+ARENA_EXTEND_STRATEGIES = {
+    'next_power_of_two': 'kNextPowerOfTwo',
+    'same_as_requested': 'kSameAsRequested'
+}
+WARM_UP_SIZE = 640
+MODEL_HASHES: Dict[Tuple[str, int, int], str] = {}
+MISSING_QUANTIZED_MODELS: Set[str] = set()
+THREAD_LOCK = threading.Lock()
+
+
+def get_execution_providers() -> List[str]:
+    execution_providers = roop.globals.execution_providers
+    if 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
+        execution_providers = ['CUDAExecutionProvider'] + [execution_provider for execution_provider in execution_providers if execution_provider != 'CUDAExecutionProvider']
+    return execution_providers
+
+
+def get_execution_provider_options(execution_provider: str) -> Dict[str, Any]:
+    if execution_provider == 'CUDAExecutionProvider' and roop.globals.execution_arena_strategy:
+        return {'arena_extend_strategy': ARENA_EXTEND_STRATEGIES[roop.globals.execution_arena_strategy]}
+    return {}
+
+
+def create_session_options() -> onnxruntime.SessionOptions:
+    thread_budget = get_thread_budget()
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = thread_budget.intra_op_threads
+    session_options.inter_op_num_threads = thread_budget.inter_op_threads
+    session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[roop.globals.execution_graph_optimization or 'all']
+    session_options.execution_mode = EXECUTION_MODES[roop.globals.execution_mode or 'sequential']
+    if roop.globals.execution_disable_memory_arena:
+        session_options.enable_cpu_mem_arena = False
+        session_options.enable_mem_pattern = False
+    return session_options
+
+
+def get_model_hash(model_path: str) -> str:
+    model_stat = os.stat(model_path)
+    model_key = (os.path.abspath(model_path), model_stat.st_mtime_ns, model_stat.st_size)
+    with THREAD_LOCK:
+        if model_key not in MODEL_HASHES:
+            model_hash = hashlib.sha256()
+            with open(model_path, 'rb') as model_file:
+                for chunk in iter(lambda: model_file.read(1024 * 1024), b''):
+                    model_hash.update(chunk)
+            MODEL_HASHES[model_key] = model_hash.hexdigest()[:16]
+    return MODEL_HASHES[model_key]
+
+
+def has_session_cache(execution_providers: List[str]) -> bool:
+    if roop.globals.execution_graph_optimization == 'disable':
+        return False
+    return not any(execution_provider in SESSION_CACHE_EXCLUDED_PROVIDERS for execution_provider in execution_providers)
+
+
+def get_session_cache_optimization() -> str:
+    graph_optimization = roop.globals.execution_graph_optimization or 'all'
+    if graph_optimization == 'all':
+        return 'extended'
+    return graph_optimization
+
+
+def get_optimized_model_path(model_path: str, execution_providers: List[str]) -> str:
+    model_name, _ = os.path.splitext(os.path.basename(model_path))
+    execution_provider = execution_providers[0].replace('ExecutionProvider', '').lower() if execution_providers else 'cpu'
+    optimized_model_name = f'{model_name}-{get_model_hash(model_path)}-ort{onnxruntime.__version__}-{platform.machine().lower()}-{execution_provider}-{get_session_cache_optimization()}.onnx'
+    return os.path.join(SESSION_CACHE_DIRECTORY, optimized_model_name)
+
+
+def create_session(model_path: str) -> onnxruntime.InferenceSession:
+    execution_providers = get_execution_providers()
+    providers = [(execution_provider, get_execution_provider_options(execution_provider)) for execution_provider in execution_providers]
+    session_options = create_session_options()
+    if not has_session_cache(execution_providers):
+        return onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+    optimized_model_path = get_optimized_model_path(model_path, execution_providers)
+    if not os.path.isfile(optimized_model_path):
+        write_optimized_model(model_path, optimized_model_path, providers)
+    if os.path.isfile(optimized_model_path):
+        if get_session_cache_optimization() == roop.globals.execution_graph_optimization:
+            session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return onnxruntime.InferenceSession(optimized_model_path, sess_options=session_options, providers=providers)
+    return onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+
+
+def write_optimized_model(model_path: str, optimized_model_path: str, providers: List[Tuple[str, Dict[str, Any]]]) -> None:
+    os.makedirs(SESSION_CACHE_DIRECTORY, exist_ok=True)
+    temp_model_path = f'{optimized_model_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    session_options = create_session_options()
+    session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[get_session_cache_optimization()]
+    session_options.optimized_model_filepath = temp_model_path
+    session_options.log_severity_level = 3
+    onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=providers)
+    if os.path.isfile(temp_model_path):
+        os.replace(temp_model_path, optimized_model_path)
+
+
+def get_quantized_model_path(model_path: str, model_precision: str) -> str:
+    return os.path.join(os.path.dirname(model_path), model_precision, os.path.basename(model_path))
+
+
+def resolve_model_path(model_path: str, model_precision: Optional[str] = None) -> str:
+    model_precision = model_precision or roop.globals.model_precision or 'fp32'
+    if model_precision != 'fp32':
+        quantized_model_path = get_quantized_model_path(model_path, model_precision)
+        if os.path.isfile(quantized_model_path):
+            return quantized_model_path
+        report_missing_quantized_model(model_path, quantized_model_path, model_precision)
+    return model_path
+
+
+def report_missing_quantized_model(model_path: str, quantized_model_path: str, model_precision: str) -> None:
+    with THREAD_LOCK:
+        if quantized_model_path in MISSING_QUANTIZED_MODELS:
+            return
+        MISSING_QUANTIZED_MODELS.add(quantized_model_path)
+    from roop.core import update_status
+    update_status(f'No {model_precision} model at {quantized_model_path}, loading {os.path.basename(model_path)} in fp32 instead.', 'ROOP.SESSION')
+
+
+def load_model(model_path: str, model_precision: Optional[str] = None) -> Any:
+    session = create_session(resolve_model_path(model_path, model_precision))
+    inputs = session.get_inputs()
+    input_shape = inputs[0].shape
+    if len(session.get_outputs()) >= 5:
+        return RetinaFace(model_file=model_path, session=session)
+    if input_shape[2] == 192 and input_shape[3] == 192:
+        return Landmark(model_file=model_path, session=session)
+    if input_shape[2] == 96 and input_shape[3] == 96:
+        return Attribute(model_file=model_path, session=session)
+    if len(inputs) == 2 and input_shape[2] == 128 and input_shape[3] == 128:
+        return INSwapper(model_file=model_path, session=session)
+    if input_shape[2] == input_shape[3] and input_shape[2] >= 112 and input_shape[2] % 16 == 0:
+        return ArcFaceONNX(model_file=model_path, session=session)
+    return None
+
+
+def warm_up_session(session: onnxruntime.InferenceSession, warm_up_size: int = WARM_UP_SIZE) -> None:
+    session_inputs = {}
+    for session_input in session.get_inputs():
+        input_shape = [dim if isinstance(dim, int) else (1 if index == 0 else warm_up_size) for index, dim in enumerate(session_input.shape)]
+        session_inputs[session_input.name] = numpy.zeros(input_shape, dtype=numpy.float32)
+    session.run(None, session_inputs)
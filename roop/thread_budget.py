@@ -0,0 +1,80 @@
+import os
+from typing import List, Optional
+import cv2
+import psutil
+
+import roop.globals
+from roop.typing import ThreadBudget
+
+THREAD_BUDGET: Optional[ThreadBudget] = None
+GPU_EXECUTION_PROVIDERS = ['CUDAExecutionProvider', 'TensorrtExecutionProvider', 'ROCMExecutionProvider', 'DmlExecutionProvider', 'CoreMLExecutionProvider']
+
+
+def get_cpu_cores() -> int:
+    if roop.globals.execution_cores:
+        return roop.globals.execution_cores
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+
+def has_gpu_execution(execution_providers: List[str]) -> bool:
+    return any(execution_provider in GPU_EXECUTION_PROVIDERS for execution_provider in execution_providers)
+
+
+def suggest_execution_threads(execution_providers: List[str], cpu_cores: int) -> int:
+    if has_gpu_execution(execution_providers):
+        return min(12, max(cpu_cores, 1) * 2)
+    return max(1, cpu_cores // 4)
+
+
+def suggest_execution_replicas(execution_providers: List[str], execution_threads: int) -> int:
+    if has_gpu_execution(execution_providers):
+        return 1
+    return execution_threads
+
+
+def create_thread_budget(cpu_cores: int, execution_providers: List[str], execution_threads: Optional[int] = None, execution_replicas: Optional[int] = None, intra_op_threads: Optional[int] = None, execution_mode: Optional[str] = None) -> ThreadBudget:
+    execution_threads = execution_threads or suggest_execution_threads(execution_providers, cpu_cores)
+    shared_replicas = not execution_replicas and has_gpu_execution(execution_providers)
+    execution_replicas = max(1, min(execution_threads, execution_replicas or suggest_execution_replicas(execution_providers, execution_threads)))
+    concurrent_sessions = execution_threads if shared_replicas else execution_replicas
+    if has_gpu_execution(execution_providers):
+        intra_op_threads = intra_op_threads or 1
+        torch_threads = 1
+    else:
+        intra_op_threads = intra_op_threads or max(1, cpu_cores // concurrent_sessions)
+        torch_threads = intra_op_threads
+    return ThreadBudget(
+        execution_threads=execution_threads,
+        execution_replicas=execution_replicas,
+        shared_replicas=shared_replicas,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=intra_op_threads if execution_mode == 'parallel' else 1,
+        torch_threads=torch_threads,
+        opencv_threads=1 if execution_threads > 1 else cpu_cores,
+        ffmpeg_threads=cpu_cores
+    )
+
+
+def get_thread_budget() -> ThreadBudget:
+    global THREAD_BUDGET
+
+    if THREAD_BUDGET is None:
+        THREAD_BUDGET = create_thread_budget(get_cpu_cores(), roop.globals.execution_providers, roop.globals.execution_threads, roop.globals.execution_replicas, roop.globals.execution_intra_op_threads, roop.globals.execution_mode)
+    return THREAD_BUDGET
+
+
+def apply_thread_budget() -> ThreadBudget:
+    thread_budget = get_thread_budget()
+    roop.globals.execution_threads = thread_budget.execution_threads
+    cv2.setNumThreads(thread_budget.opencv_threads)
+    return thread_budget
+
+
+def clear_thread_budget() -> None:
+    global THREAD_BUDGET
+
+    THREAD_BUDGET = None
+
+
+def format_thread_budget(thread_budget: ThreadBudget) -> str:
+    return f'ort {thread_budget.intra_op_threads}/{thread_budget.inter_op_threads} torch {thread_budget.torch_threads} opencv {thread_budget.opencv_threads} ffmpeg {thread_budget.ffmpeg_threads}'
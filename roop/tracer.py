@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import roop.globals
+from roop.metrics import is_metrics_enabled, observe_histogram
+
+TRACE_EVENTS: List[Dict[str, Any]] = []
+TRACE_THREADS: Dict[int, str] = {}
+TRACE_START = time.perf_counter()
+THREAD_LOCK = threading.Lock()
+
+
+def get_trace_timestamp(timestamp: float) -> float:
+    return round((timestamp - TRACE_START) * 1000000, 3)
+
+
+def add_trace_event(name: str, start_time: float, end_time: float, args: Dict[str, Any]) -> None:
+    thread = threading.current_thread()
+    trace_event = {
+        'name': name,
+        'cat': name.split('.')[0],
+        'ph': 'X',
+        'ts': get_trace_timestamp(start_time),
+        'dur': round((end_time - start_time) * 1000000, 3),
+        'pid': os.getpid(),
+        'tid': thread.ident,
+        'args': args
+    }
+    with THREAD_LOCK:
+        TRACE_EVENTS.append(trace_event)
+        TRACE_THREADS.setdefault(thread.ident or 0, thread.name)
+
+
+@contextmanager
+def trace_span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    if not roop.globals.trace_path and not is_metrics_enabled():
+        yield args
+        return
+    start_time = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end_time = time.perf_counter()
+        if roop.globals.trace_path:
+            add_trace_event(name, start_time, end_time, args)
+        if is_metrics_enabled():
+            observe_histogram('stage_seconds', end_time - start_time, stage=name)
+            if 'faces' in args:
+                observe_histogram('faces_per_frame', args['faces'], stage=name)
+
+
+def write_trace() -> None:
+    if roop.globals.trace_path:
+        with THREAD_LOCK:
+            trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_ident, 'args': {'name': thread_name}} for thread_ident, thread_name in TRACE_THREADS.items()] + TRACE_EVENTS
+        with open(roop.globals.trace_path, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+def clear_trace() -> None:
+    with THREAD_LOCK:
+        TRACE_EVENTS.clear()
+        TRACE_THREADS.clear()
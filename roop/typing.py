@@ -1,7 +1,42 @@
-from typing import Any
+from typing import Any, NamedTuple, Optional, Tuple
 
 from insightface.app.common import Face
 import numpy
 
 Face = Face
 Frame = numpy.ndarray[Any, Any]
+Matrix = numpy.ndarray[Any, Any]
+Detection = Tuple[numpy.ndarray[Any, Any], Optional[numpy.ndarray[Any, Any]]]
+
+
+class MediaInfo(NamedTuple):
+    fps: float
+    frame_total: int
+    width: int
+    height: int
+    audio_streams: int
+
+
+class FaceSegment(NamedTuple):
+    start: float
+    end: float
+    faces: bool
+
+
+class ThreadBudget(NamedTuple):
+    execution_threads: int
+    execution_replicas: int
+    shared_replicas: bool
+    intra_op_threads: int
+    inter_op_threads: int
+    torch_threads: int
+    opencv_threads: int
+    ffmpeg_threads: int
+
+
+class AutotuneConfig(NamedTuple):
+    execution_threads: int
+    execution_replicas: int
+    execution_batch_size: int
+    intra_op_threads: int
+    frames_per_second: float
@@ -1,19 +1,24 @@
 import os
 import sys
+import traceback
 import webbrowser
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from queue import Queue, Empty
 import customtkinter as ctk
 from tkinterdnd2 import TkinterDnD, DND_ALL
-from typing import Any, Callable, Tuple, Optional
+from typing import Any, Callable, Dict, Tuple, Optional
 import cv2
 from PIL import Image, ImageOps
 
 import roop.globals
 import roop.metadata
-from roop.face_analyser import get_one_face
-from roop.capturer import get_video_frame, get_video_frame_total
+from roop.face_analyser import get_one_face, analyse_source_face
+from roop.capturer import get_video_frame, get_video_frame_total, clear_video_captures
 from roop.face_reference import get_face_reference, set_face_reference, clear_face_reference
 from roop.predictor import predict_frame, clear_predictor
 from roop.processors.frame.core import get_frame_processors_modules
+from roop.typing import Face, Frame
 from roop.utilities import is_image, is_video, resolve_relative_path
 
 ROOT = None
@@ -23,6 +28,14 @@ ROOT_WIDTH = 600
 PREVIEW = None
 PREVIEW_MAX_HEIGHT = 700
 PREVIEW_MAX_WIDTH = 1200
+PREVIEW_PROXY_MAX_HEIGHT = 360
+PREVIEW_PROXY_MAX_WIDTH = 640
+PREVIEW_POLL_DELAY = 20
+PREVIEW_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+PREVIEW_QUEUE: Queue[Tuple[int, Any]] = Queue()
+PREVIEW_REQUEST = 0
+
+SOURCE_FACES: Dict[str, Optional[Face]] = {}
 
 RECENT_DIRECTORY_SOURCE = None
 RECENT_DIRECTORY_TARGET = None
@@ -136,6 +149,7 @@ def create_preview(parent: ctk.CTkToplevel) -> ctk.CTkToplevel:
 
     preview.bind('<Up>', lambda event: update_face_reference(1))
     preview.bind('<Down>', lambda event: update_face_reference(-1))
+    preview.after(PREVIEW_POLL_DELAY, poll_preview)
     return preview
 
 
@@ -149,6 +163,7 @@ def select_source_path(source_path: Optional[str] = None) -> None:
 
     if PREVIEW:
         PREVIEW.withdraw()
+    SOURCE_FACES.clear()
     if source_path is None:
         source_path = ctk.filedialog.askopenfilename(title='select an source image', initialdir=RECENT_DIRECTORY_SOURCE)
     if is_image(source_path):
@@ -167,6 +182,7 @@ def select_target_path(target_path: Optional[str] = None) -> None:
     if PREVIEW:
         PREVIEW.withdraw()
     clear_face_reference()
+    clear_video_captures()
     if target_path is None:
         target_path = ctk.filedialog.askopenfilename(title='select an target image or video', initialdir=RECENT_DIRECTORY_TARGET)
     if is_image(target_path):
@@ -207,17 +223,13 @@ def render_image_preview(image_path: str, size: Tuple[int, int]) -> ctk.CTkImage
 
 
 def render_video_preview(video_path: str, size: Tuple[int, int], frame_number: int = 0) -> ctk.CTkImage:
-    capture = cv2.VideoCapture(video_path)
-    if frame_number:
-        capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-    has_frame, frame = capture.read()
-    if has_frame:
-        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    temp_frame = get_video_frame(video_path, frame_number)
+    if temp_frame is not None:
+        image = Image.fromarray(cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB))
         if size:
             image = ImageOps.fit(image, size, Image.LANCZOS)
         return ctk.CTkImage(image, size=image.size)
-    capture.release()
-    cv2.destroyAllWindows()
+    return None
 
 
 def toggle_preview() -> None:
@@ -248,27 +260,80 @@ def init_preview() -> None:
 
 
 def update_preview(frame_number: int = 0) -> None:
+    global PREVIEW_REQUEST
+
     if roop.globals.source_path and roop.globals.target_path:
-        temp_frame = get_video_frame(roop.globals.target_path, frame_number)
-        if predict_frame(temp_frame):
-            sys.exit()
-        source_face = get_one_face(cv2.imread(roop.globals.source_path))
-        if not get_face_reference():
-            reference_frame = get_video_frame(roop.globals.target_path, roop.globals.reference_frame_number)
-            reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
-            set_face_reference(reference_face)
-        else:
-            reference_face = get_face_reference()
+        PREVIEW_REQUEST += 1
+        preview_future = PREVIEW_EXECUTOR.submit(render_preview, PREVIEW_REQUEST, int(frame_number))
+        preview_future.add_done_callback(partial(report_preview_exception, PREVIEW_REQUEST))
+
+
+def report_preview_exception(preview_request: int, preview_future: Future[None]) -> None:
+    preview_exception = preview_future.exception()
+    if preview_exception:
+        traceback.print_exception(type(preview_exception), preview_exception, preview_exception.__traceback__)
+        PREVIEW_QUEUE.put((preview_request, preview_exception))
+
+
+def render_preview(preview_request: int, frame_number: int) -> None:
+    temp_frame = get_video_frame(roop.globals.target_path, frame_number)
+    if temp_frame is None or preview_request != PREVIEW_REQUEST:
+        return
+    if predict_frame(temp_frame):
+        PREVIEW_QUEUE.put((preview_request, None))
+        return
+    source_face = get_source_face(roop.globals.source_path)
+    if not get_face_reference():
+        reference_frame = get_video_frame(roop.globals.target_path, roop.globals.reference_frame_number)
+        reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
+        set_face_reference(reference_face)
+    else:
+        reference_face = get_face_reference()
+    preview_frames = [temp_frame]
+    proxy_frame = resize_frame(temp_frame, (PREVIEW_PROXY_MAX_WIDTH, PREVIEW_PROXY_MAX_HEIGHT))
+    if proxy_frame is not temp_frame:
+        preview_frames.insert(0, proxy_frame)
+    for preview_frame in preview_frames:
         for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
-            temp_frame = frame_processor.process_frame(
+            if preview_request != PREVIEW_REQUEST:
+                return
+            preview_frame = frame_processor.process_frame(
                 source_face,
                 reference_face,
-                temp_frame
+                preview_frame
             )
-        image = Image.fromarray(cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB))
+        image = Image.fromarray(cv2.cvtColor(preview_frame, cv2.COLOR_BGR2RGB))
         image = ImageOps.contain(image, (PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT), Image.LANCZOS)
-        image = ctk.CTkImage(image, size=image.size)
-        preview_label.configure(image=image)
+        PREVIEW_QUEUE.put((preview_request, image))
+
+
+def poll_preview() -> None:
+    try:
+        while True:
+            preview_request, image = PREVIEW_QUEUE.get_nowait()
+            if image is None:
+                sys.exit()
+            if isinstance(image, Exception):
+                update_status(f'Preview failed: {image}')
+            elif preview_request == PREVIEW_REQUEST:
+                preview_label.configure(image=ctk.CTkImage(image, size=image.size))
+    except Empty:
+        pass
+    PREVIEW.after(PREVIEW_POLL_DELAY, poll_preview)
+
+
+def get_source_face(source_path: str) -> Optional[Face]:
+    if source_path not in SOURCE_FACES:
+        SOURCE_FACES[source_path] = analyse_source_face(cv2.imread(source_path))
+    return SOURCE_FACES[source_path]
+
+
+def resize_frame(temp_frame: Frame, size: Tuple[int, int]) -> Frame:
+    height, width = temp_frame.shape[:2]
+    scale = min(size[0] / width, size[1] / height)
+    if scale < 1:
+        return cv2.resize(temp_frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return temp_frame
 
 
 def update_face_reference(steps: int) -> None:
@@ -2,6 +2,7 @@ import glob
 import mimetypes
 import os
 import platform
+import re
 import shutil
 import ssl
 import subprocess
@@ -11,9 +12,23 @@ from typing import List, Optional
 from tqdm import tqdm
 
 import roop.globals
+from roop.probe import get_media_info
+from roop.thread_budget import get_thread_budget
+from roop.tracer import trace_span
 
 TEMP_DIRECTORY = 'temp'
 TEMP_VIDEO_FILE = 'temp.mp4'
+NVENC_PRESETS = {
+    'ultrafast': 'p1',
+    'superfast': 'p1',
+    'veryfast': 'p2',
+    'faster': 'p3',
+    'fast': 'p4',
+    'medium': 'p5',
+    'slow': 'p6',
+    'slower': 'p7',
+    'veryslow': 'p7'
+}
 
 # monkey patch ssl for mac
 if platform.system().lower() == 'darwin':
@@ -21,10 +36,11 @@ if platform.system().lower() == 'darwin':
 
 
 def run_ffmpeg(args: List[str]) -> bool:
-    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.log_level]
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.log_level, '-threads', str(get_thread_budget().ffmpeg_threads)]
     commands.extend(args)
     try:
-        subprocess.check_output(commands, stderr=subprocess.STDOUT)
+        with trace_span('ffmpeg.run', arguments=' '.join(args)):
+            subprocess.check_output(commands, stderr=subprocess.STDOUT)
         return True
     except Exception:
         pass
@@ -32,13 +48,9 @@ def run_ffmpeg(args: List[str]) -> bool:
 
 
 def detect_fps(target_path: str) -> float:
-    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=r_frame_rate', '-of', 'default=noprint_wrappers=1:nokey=1', target_path]
-    output = subprocess.check_output(command).decode().strip().split('/')
-    try:
-        numerator, denominator = map(int, output)
-        return numerator / denominator
-    except Exception:
-        pass
+    media_info = get_media_info(target_path)
+    if media_info:
+        return media_info.fps
     return 30
 
 
@@ -48,6 +60,16 @@ def extract_frames(target_path: str, fps: float = 30) -> bool:
     return run_ffmpeg(['-hwaccel', 'auto', '-i', target_path, '-q:v', str(temp_frame_quality), '-pix_fmt', 'rgb24', '-vf', 'fps=' + str(fps), os.path.join(temp_directory_path, '%04d.' + roop.globals.temp_frame_format)])
 
 
+def detect_scene_cuts(target_path: str, fps: float = 30) -> List[int]:
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', 'info', '-threads', str(get_thread_budget().ffmpeg_threads), '-i', target_path, '-an', '-vf', 'fps=' + str(fps) + ',setpts=N/FRAME_RATE/TB,scale=256:-2,select=gt(scene\\,' + str(roop.globals.scene_cut_threshold) + '),showinfo', '-f', 'null', '-']
+    try:
+        with trace_span('ffmpeg.scene_cuts'):
+            output = subprocess.run(commands, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True).stderr.decode(errors='ignore')
+    except Exception:
+        return []
+    return sorted({round(float(presentation_time) * fps) + 1 for presentation_time in re.findall(r'pts_time:\s*([\d.]+)', output)})
+
+
 def create_video(target_path: str, fps: float = 30) -> bool:
     temp_output_path = get_temp_output_path(target_path)
     temp_directory_path = get_temp_directory_path(target_path)
@@ -57,7 +79,11 @@ def create_video(target_path: str, fps: float = 30) -> bool:
         commands.extend(['-crf', str(output_video_quality)])
     if roop.globals.output_video_encoder in ['h264_nvenc', 'hevc_nvenc']:
         commands.extend(['-cq', str(output_video_quality)])
-    commands.extend(['-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1', '-y', temp_output_path])
+    if roop.globals.output_video_preset and roop.globals.output_video_encoder in ['libx264', 'libx265']:
+        commands.extend(['-preset', roop.globals.output_video_preset])
+    if roop.globals.output_video_preset and roop.globals.output_video_encoder in ['h264_nvenc', 'hevc_nvenc']:
+        commands.extend(['-preset', NVENC_PRESETS[roop.globals.output_video_preset]])
+    commands.extend(['-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1', '-threads', str(get_thread_budget().ffmpeg_threads), '-y', temp_output_path])
     return run_ffmpeg(commands)
 
 
@@ -70,7 +96,12 @@ def restore_audio(target_path: str, output_path: str) -> None:
 
 def get_temp_frame_paths(target_path: str) -> List[str]:
     temp_directory_path = get_temp_directory_path(target_path)
-    return glob.glob((os.path.join(glob.escape(temp_directory_path), '*.' + roop.globals.temp_frame_format)))
+    return sorted(glob.glob((os.path.join(glob.escape(temp_directory_path), '*.' + roop.globals.temp_frame_format))), key=get_temp_frame_number)
+
+
+def get_temp_frame_number(temp_frame_path: str) -> int:
+    temp_frame_name, _ = os.path.splitext(os.path.basename(temp_frame_path))
+    return int(temp_frame_name)
 
 
 def get_temp_directory_path(target_path: str) -> str:
@@ -6,17 +6,113 @@ Analizador automático de videos para configuración óptima de detección de ro
 import cv2
 import numpy as np
 from pathlib import Path
+import hashlib
 import json
 import os
-from typing import Dict, List, Tuple, Optional
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Optional
+
+try:
+    from roop.probe import get_media_info, get_media_keyframes
+except ImportError:
+    # Sin el paquete roop se usan las propiedades de OpenCV
+    get_media_info = None
+    get_media_keyframes = None
+
+CACHE_FILE = "video_analysis_cache.db"
+# Se incrementa cuando cambia el análisis para invalidar resultados anteriores
+ANALYSIS_VERSION = 5
+# Muestras repartidas en todo el video donde se detectan rostros
+ANALYSIS_SAMPLE_TOTAL = 20
+# Muestras extra alrededor de los cortes de escena para la línea de tiempo de rostros
+ANALYSIS_TRANSITION_SAMPLE_MAX = 40
+KEYFRAME_SAMPLE_MIN = 10
+# Los frames de muestra se analizan en gris y a resolución reducida
+ANALYSIS_WIDTH = 640
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
+FINGERPRINT_CHUNK_TOTAL = 8
+TIMELINE_DIRECTORY = "face_timelines"
+# Distancia de Bhattacharyya entre histogramas que se considera corte de escena
+SCENE_CUT_THRESHOLD = 0.4
+# Una escena solo se marca sin rostros con al menos estas muestras sin rostros
+TIMELINE_SCENE_SAMPLE_MIN = 2
+# Duración (segundos) a partir de la cual se usa un preset de codificación más rápido
+MEDIUM_CLIP_SECONDS = 180
+LONG_CLIP_SECONDS = 600
+
+def get_video_fingerprint(video_path: str) -> str:
+    """
+    Huella del contenido: tamaño, mtime y hash de bloques muestreados del archivo
+    """
+    stat = os.stat(video_path)
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    chunk_offsets = np.linspace(0, max(stat.st_size - FINGERPRINT_CHUNK_SIZE, 0), FINGERPRINT_CHUNK_TOTAL, dtype=np.int64)
+    with open(video_path, 'rb') as video_file:
+        for chunk_offset in sorted(set(chunk_offsets.tolist())):
+            video_file.seek(chunk_offset)
+            digest.update(video_file.read(FINGERPRINT_CHUNK_SIZE))
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """
+    Cache de análisis en SQLite (modo WAL) indexado por huella de contenido,
+    seguro con varios procesos escribiendo a la vez
+    """
+
+    def __init__(self, cache_file: str = CACHE_FILE):
+        self.cache_file = cache_file
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS analysis ("
+                "fingerprint TEXT PRIMARY KEY, version INTEGER NOT NULL, path TEXT NOT NULL, "
+                "config TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación: sqlite serializa a los escritores concurrentes
+        connection = sqlite3.connect(self.cache_file, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, fingerprint: str) -> Optional[Dict]:
+        try:
+            with self.connect() as connection:
+                row = connection.execute(
+                    "SELECT config FROM analysis WHERE fingerprint = ? AND version = ?",
+                    (fingerprint, ANALYSIS_VERSION)
+                ).fetchone()
+            return json.loads(row[0]) if row else None
+        except sqlite3.Error:
+            return None
+
+    def put(self, fingerprint: str, video_path: str, config: Dict):
+        try:
+            with self.connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO analysis (fingerprint, version, path, config, created) VALUES (?, ?, ?, ?, ?)",
+                    (fingerprint, ANALYSIS_VERSION, video_path, json.dumps(config), time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️  No se pudo guardar el análisis en cache: {e}")
 
 class VideoAnalyzer:
-    def __init__(self):
+    def __init__(self, cache_file: str = CACHE_FILE):
         self.face_cascade = None
         self.eye_cascade = None
-        self.analysis_cache = {}
-        self.cache_file = "video_analysis_cache.json"
-        self.load_cache()
+        self.analysis_cache = AnalysisCache(cache_file)
+        # Resultados de esta sesión por ruta, para los reportes
+        self.analysis_results = {}
         
         # Intentar cargar cascadas de OpenCV
         try:
@@ -25,62 +121,48 @@ class VideoAnalyzer:
         except:
             print("⚠️  OpenCV no disponible, usando análisis básico")
     
-    def load_cache(self):
-        """Carga el cache de análisis previos"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r') as f:
-                    self.analysis_cache = json.load(f)
-        except:
-            self.analysis_cache = {}
-    
-    def save_cache(self):
-        """Guarda el cache de análisis"""
-        try:
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.analysis_cache, f, indent=2)
-        except:
-            pass
-    
     def analyze_video_auto(self, video_path: str) -> Dict:
         """
         Analiza automáticamente un video y retorna la configuración óptima
         """
         video_path = str(video_path)
         
-        # Verificar cache
-        if video_path in self.analysis_cache:
+        try:
+            fingerprint = get_video_fingerprint(video_path)
+        except OSError as e:
+            print(f"❌ Error analizando {Path(video_path).name}: {e}")
+            return self.get_default_config()
+        
+        # Verificar cache por contenido (sobrevive a renombrados y detecta archivos reemplazados)
+        config = self.analysis_cache.get(fingerprint)
+        if config is not None:
             print(f"📋 Usando análisis cacheado para {Path(video_path).name}")
-            return self.analysis_cache[video_path]
+            self.analysis_results[video_path] = config
+            return config
         
         print(f"🔍 Analizando video: {Path(video_path).name}")
         
         try:
-            # Abrir video
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("No se pudo abrir el video")
-            
-            # Obtener información básica
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            # Obtener información básica (una sola consulta ffprobe cacheada)
+            fps, frame_count, width, height, keyframes = self.get_video_info(video_path)
             duration = frame_count / fps if fps > 0 else 0
             
             # Analizar frames clave
-            face_count, face_sizes, quality_score = self.analyze_frames(cap, frame_count)
-            
-            cap.release()
+            face_count, face_sizes, quality_score, timeline_samples = self.analyze_frames(video_path, frame_count, width, height, keyframes)
             
             # Determinar configuración óptima
             config = self.determine_optimal_config(
                 width, height, fps, duration, face_count, face_sizes, quality_score
             )
+            config["performance_profile"] = self.determine_performance_profile(
+                width, height, duration, face_sizes, quality_score
+            )
+            config["face_timeline"] = self.build_face_timeline(timeline_samples, fps, duration)
+            config["analysis_info"]["faceless_seconds"] = round(sum(segment["end"] - segment["start"] for segment in config["face_timeline"] if not segment["faces"]), 2)
             
             # Guardar en cache
-            self.analysis_cache[video_path] = config
-            self.save_cache()
+            self.analysis_cache.put(fingerprint, video_path, config)
+            self.analysis_results[video_path] = config
             
             return config
             
@@ -89,25 +171,118 @@ class VideoAnalyzer:
             # Configuración por defecto
             return self.get_default_config()
     
-    def analyze_frames(self, cap: cv2.VideoCapture, total_frames: int) -> Tuple[int, List[float], float]:
+    def get_video_info(self, video_path: str) -> Tuple[float, int, int, int, List[int]]:
+        """
+        Obtiene fps, número de frames, resolución y keyframes desde el probe compartido con roop
+        """
+        media_info = get_media_info(video_path) if get_media_info else None
+        if media_info:
+            return media_info.fps, media_info.frame_total, media_info.width, media_info.height, get_media_keyframes(video_path)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception("No se pudo abrir el video")
+        video_info = (
+            cap.get(cv2.CAP_PROP_FPS),
+            int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            []
+        )
+        cap.release()
+        return video_info
+    
+    def prepare_sample_frame(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Reduce el frame a gris y a ANALYSIS_WIDTH de ancho como máximo
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        if width > ANALYSIS_WIDTH:
+            gray = cv2.resize(gray, (ANALYSIS_WIDTH, max(1, round(height * ANALYSIS_WIDTH / width))), interpolation=cv2.INTER_AREA)
+        return gray
+    
+    def read_keyframes(self, video_path: str, width: int, height: int, keyframes: List[int]) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Decodifica solo los keyframes en una única pasada de ffmpeg (-skip_frame nokey),
+        ya reducidos a gris y a ANALYSIS_WIDTH, sin búsquedas en el contenedor
+        """
+        sample_width = min(ANALYSIS_WIDTH, width)
+        sample_height = max(1, round(height * sample_width / width))
+        commands = [
+            'ffmpeg', '-v', 'error', '-skip_frame', 'nokey', '-i', video_path, '-an', '-sn',
+            '-vf', f'scale={sample_width}:{sample_height}', '-vsync', '0',
+            '-pix_fmt', 'gray', '-f', 'rawvideo', 'pipe:'
+        ]
+        frame_size = sample_width * sample_height
+        process = subprocess.Popen(commands, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            for frame_idx in keyframes:
+                buffer = process.stdout.read(frame_size)
+                if len(buffer) < frame_size:
+                    break
+                yield frame_idx, np.frombuffer(buffer, dtype=np.uint8).reshape(sample_height, sample_width)
+        finally:
+            process.kill()
+            process.wait()
+    
+    def read_sample_frames(self, video_path: str, total_frames: int, width: int, height: int, keyframes: List[int]) -> List[Tuple[int, np.ndarray]]:
+        """
+        Lee los frames de muestra sin búsquedas: los keyframes en una pasada de ffmpeg
+        o, sin índice de keyframes, una pasada secuencial con OpenCV. De los keyframes se
+        toman las muestras repartidas y, en cada corte de escena, el keyframe anterior y
+        el posterior para que la línea de tiempo vea el inicio y el final de cada escena
+        """
+        samples = []
+        if len(keyframes) >= KEYFRAME_SAMPLE_MIN and width > 0 and height > 0 and shutil.which('ffmpeg'):
+            keyframe_positions = set(np.linspace(0, len(keyframes) - 1, min(ANALYSIS_SAMPLE_TOTAL, len(keyframes)), dtype=int).tolist())
+            transition_total = 0
+            previous_sample = None
+            previous_histogram = None
+            for position, (frame_idx, frame) in enumerate(self.read_keyframes(video_path, width, height, keyframes)):
+                histogram = self.get_frame_histogram(frame)
+                is_transition = previous_histogram is not None and cv2.compareHist(previous_histogram, histogram, cv2.HISTCMP_BHATTACHARYYA) > SCENE_CUT_THRESHOLD
+                if is_transition and transition_total < ANALYSIS_TRANSITION_SAMPLE_MAX:
+                    transition_total += 1
+                    if previous_sample is not None and (not samples or samples[-1][0] != previous_sample[0]):
+                        samples.append(previous_sample)
+                    samples.append((frame_idx, frame))
+                elif position in keyframe_positions:
+                    samples.append((frame_idx, frame))
+                previous_sample = (frame_idx, frame)
+                previous_histogram = histogram
+            if samples:
+                return samples
+        
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception("No se pudo abrir el video")
+        
+        if total_frames > 0:
+            # Sin índice de keyframes: una sola pasada secuencial, decodificando solo las muestras
+            frame_indices = set(np.linspace(0, total_frames - 1, min(ANALYSIS_SAMPLE_TOTAL, total_frames), dtype=int).tolist())
+            last_frame_idx = max(frame_indices)
+            frame_idx = 0
+            while frame_idx <= last_frame_idx and cap.grab():
+                if frame_idx in frame_indices:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        samples.append((frame_idx, self.prepare_sample_frame(frame)))
+                frame_idx += 1
+        
+        cap.release()
+        return samples
+    
+    def analyze_frames(self, video_path: str, total_frames: int, width: int, height: int, keyframes: List[int]) -> Tuple[int, List[float], float, List[Tuple[int, bool, np.ndarray]]]:
         """
-        Analiza frames del video para detectar rostros y calidad
+        Analiza frames del video para detectar rostros y calidad, y guarda por muestra
+        si hay rostros y su histograma para la línea de tiempo
         """
         face_count = 0
         face_sizes = []
         quality_scores = []
+        timeline_samples = []
         
-        # Analizar frames espaciados uniformemente
-        sample_frames = min(20, total_frames)  # Máximo 20 frames
-        frame_indices = np.linspace(0, total_frames-1, sample_frames, dtype=int)
-        
-        for frame_idx in frame_indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-            
-            if not ret:
-                continue
-            
+        for frame_idx, frame in self.read_sample_frames(video_path, total_frames, width, height, keyframes):
             # Analizar calidad del frame
             quality = self.analyze_frame_quality(frame)
             quality_scores.append(quality)
@@ -120,16 +295,56 @@ class VideoAnalyzer:
                 for face in faces:
                     face_size = (face[2] * face[3]) / (frame.shape[0] * frame.shape[1])
                     face_sizes.append(face_size)
+                
+                timeline_samples.append((frame_idx, len(faces) > 0, self.get_frame_histogram(frame)))
         
         avg_quality = np.mean(quality_scores) if quality_scores else 0.5
-        return face_count, face_sizes, avg_quality
+        return face_count, face_sizes, avg_quality, timeline_samples
+    
+    def get_frame_histogram(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Histograma normalizado del frame en gris para comparar escenas
+        """
+        histogram = cv2.calcHist([frame], [0], None, [32], [0, 256])
+        return cv2.normalize(histogram, histogram)
+    
+    def build_face_timeline(self, timeline_samples: List[Tuple[int, bool, np.ndarray]], fps: float, duration: float) -> List[Dict]:
+        """
+        Agrupa las muestras en escenas separadas por cortes y marca sin rostros solo las
+        escenas donde ninguna muestra tiene rostros. El segmento va de la primera a la
+        última muestra de la escena: el resto queda como "con rostros" y se procesa
+        """
+        if fps <= 0 or not timeline_samples:
+            return [{"start": 0.0, "end": round(duration, 3), "faces": True}]
+        
+        scenes = []
+        previous_histogram = None
+        for frame_idx, has_faces, histogram in timeline_samples:
+            if previous_histogram is None or cv2.compareHist(previous_histogram, histogram, cv2.HISTCMP_BHATTACHARYYA) > SCENE_CUT_THRESHOLD:
+                scenes.append([])
+            scenes[-1].append((frame_idx, has_faces))
+            previous_histogram = histogram
+        
+        timeline = []
+        position = 0.0
+        for scene in scenes:
+            if len(scene) < TIMELINE_SCENE_SAMPLE_MIN or any(has_faces for _, has_faces in scene):
+                continue
+            start, end = scene[0][0] / fps, scene[-1][0] / fps
+            if start > position:
+                timeline.append({"start": round(position, 3), "end": round(start, 3), "faces": True})
+            timeline.append({"start": round(start, 3), "end": round(end, 3), "faces": False})
+            position = end
+        if position < duration or not timeline:
+            timeline.append({"start": round(position, 3), "end": round(duration, 3), "faces": True})
+        return timeline
     
     def detect_faces_in_frame(self, frame: np.ndarray) -> List:
         """
         Detecta rostros en un frame usando OpenCV
         """
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             faces = self.face_cascade.detectMultiScale(
                 gray, 
                 scaleFactor=1.1, 
@@ -146,7 +361,7 @@ class VideoAnalyzer:
         """
         try:
             # Convertir a escala de grises
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             
             # Calcular nitidez usando Laplaciano
             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
@@ -223,6 +438,54 @@ class VideoAnalyzer:
         
         return config
     
+    def determine_performance_profile(self, width: int, height: int, duration: float,
+                                      face_sizes: List[float], quality_score: float) -> Dict:
+        """
+        Determina el perfil de rendimiento: tamaño del detector, formato de frames
+        temporales, hilos de ejecución y preset del codificador
+        """
+        profile = {
+            "face_detector_size": 640,
+            "temp_frame_format": "png",
+            "temp_frame_quality": "0",
+            "execution_threads": None,
+            "output_video_preset": None
+        }
+        
+        # Tamaño del detector según el tamaño de los rostros
+        if face_sizes:
+            avg_face_size = np.mean(face_sizes)
+            if avg_face_size > 0.1:
+                profile["face_detector_size"] = 320
+                print(f"   ⚡ Rostros cercanos - Detector reducido a 320")
+            elif avg_face_size < 0.01 and min(width, height) >= 2160:
+                profile["face_detector_size"] = 1280
+                print(f"   🔭 Rostros pequeños en 4K - Detector ampliado a 1280")
+            elif avg_face_size < 0.01 and min(width, height) >= 1080:
+                profile["face_detector_size"] = 960
+                print(f"   🔭 Rostros pequeños en alta resolución - Detector ampliado a 960")
+        
+        # JPG para fuentes de baja calidad o clips largos (PNG no aporta y es más lento)
+        # En roop la calidad 0 es la máxima para JPG (q:v = calidad * 31 // 100)
+        if quality_score < 0.4 or duration > LONG_CLIP_SECONDS:
+            profile["temp_frame_format"] = "jpg"
+            print(f"   🖼️  Frames temporales en JPG")
+        
+        # Los frames 4K ocupan mucha memoria por hilo
+        if min(width, height) >= 2160:
+            profile["execution_threads"] = 4
+            print(f"   🧵 Resolución 4K - Limitando a 4 hilos de ejecución")
+        
+        # Preset de codificación más rápido para clips largos
+        if duration > LONG_CLIP_SECONDS:
+            profile["output_video_preset"] = "veryfast"
+        elif duration > MEDIUM_CLIP_SECONDS:
+            profile["output_video_preset"] = "faster"
+        if profile["output_video_preset"]:
+            print(f"   🎞️  Clip de {duration / 60:.1f} minutos - Preset de codificación {profile['output_video_preset']}")
+        
+        return profile
+    
     def get_default_config(self) -> Dict:
         """
         Retorna configuración por defecto
@@ -239,11 +502,11 @@ class VideoAnalyzer:
         """
         Imprime un reporte detallado del análisis
         """
-        if video_path not in self.analysis_cache:
+        if video_path not in self.analysis_results:
             print(f"❌ No hay análisis disponible para {Path(video_path).name}")
             return
         
-        config = self.analysis_cache[video_path]
+        config = self.analysis_results[video_path]
         info = config.get("analysis_info", {})
         
         print(f"\n📊 REPORTE DE ANÁLISIS: {Path(video_path).name}")
@@ -256,6 +519,7 @@ class VideoAnalyzer:
             print(f"👥 Rostros detectados: {info.get('face_count', 'N/A')}")
             print(f"🔍 Tamaño promedio de rostros: {info.get('avg_face_size', 'N/A')}")
             print(f"✨ Puntuación de calidad: {info.get('quality_score', 'N/A')}")
+            print(f"⏭️  Segundos sin rostros: {info.get('faceless_seconds', 'N/A')}")
         else:
             print("⚠️  Análisis no disponible")
         
@@ -264,10 +528,18 @@ class VideoAnalyzer:
         print(f"  • Distancia de rostros: {config['similar_face_distance']}")
         print(f"  • Posición de referencia: {config['reference_face_position']}")
         print(f"  • Calidad de frames: {config['temp_frame_quality']}")
+        
+        profile = config.get("performance_profile")
+        if profile:
+            print(f"\n⚡ PERFIL DE RENDIMIENTO:")
+            print(f"  • Tamaño del detector: {profile['face_detector_size']}")
+            print(f"  • Formato de frames temporales: {profile['temp_frame_format']}")
+            print(f"  • Hilos de ejecución: {profile['execution_threads'] or 'automático'}")
+            print(f"  • Preset de codificación: {profile['output_video_preset'] or 'por defecto'}")
     
-    def analyze_all_videos_in_folder(self, folder_path: str = "videos_input"):
+    def analyze_all_videos_in_folder(self, folder_path: str = "videos_input", workers: Optional[int] = None):
         """
-        Analiza automáticamente todos los videos en una carpeta
+        Analiza automáticamente todos los videos en una carpeta, varios a la vez en procesos separados
         """
         folder = Path(folder_path)
         if not folder.exists():
@@ -284,25 +556,84 @@ class VideoAnalyzer:
             print(f"⚠️  No se encontraron videos en {folder_path}")
             return
         
-        print(f"🔍 Analizando {len(video_files)} videos automáticamente...")
+        # Los videos ya cacheados no pasan por el pool
+        pending_files = []
+        for video_file in video_files:
+            try:
+                config = self.analysis_cache.get(get_video_fingerprint(str(video_file)))
+            except OSError:
+                config = None
+            if config is None:
+                pending_files.append(video_file)
+            else:
+                self.analysis_results[str(video_file)] = config
+        
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending_files) or 1))
+        print(f"🔍 Analizando {len(video_files)} videos automáticamente ({len(video_files) - len(pending_files)} en cache, {workers} procesos)...")
         print("=" * 60)
         
+        if pending_files:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_analysis_worker) as executor:
+                futures = {executor.submit(analyze_video_worker, str(video_file)): video_file for video_file in pending_files}
+                for future in as_completed(futures):
+                    video_file = futures[future]
+                    try:
+                        self.analysis_results[str(video_file)] = future.result()
+                    except Exception as e:
+                        print(f"❌ Error analizando {video_file.name}: {e}")
+        
         for video_file in video_files:
-            try:
-                self.analyze_video_auto(str(video_file))
+            if str(video_file) in self.analysis_results:
                 self.print_analysis_report(str(video_file))
                 print("-" * 40)
-            except Exception as e:
-                print(f"❌ Error analizando {video_file.name}: {e}")
         
         print("\n✅ Análisis automático completado")
         print("💡 Los resultados se usarán automáticamente en el procesamiento")
 
+ANALYZER = None
+ANALYZER_LOCK = threading.Lock()
+
+def get_analyzer() -> VideoAnalyzer:
+    """
+    Devuelve el analizador compartido (cascadas y cache se cargan una sola vez)
+    """
+    global ANALYZER
+    
+    with ANALYZER_LOCK:
+        if ANALYZER is None:
+            ANALYZER = VideoAnalyzer()
+    return ANALYZER
+
+def write_face_timeline(video_path: str, config: Dict) -> Optional[str]:
+    """
+    Escribe la línea de tiempo de rostros para --face-timeline de roop, solo si hay segmentos sin rostros
+    """
+    face_timeline = config.get("face_timeline", [])
+    if all(segment["faces"] for segment in face_timeline):
+        return None
+    os.makedirs(TIMELINE_DIRECTORY, exist_ok=True)
+    timeline_path = os.path.join(TIMELINE_DIRECTORY, f"{Path(video_path).stem}-{get_video_fingerprint(video_path)[:16]}.json")
+    with open(timeline_path, 'w') as timeline_file:
+        json.dump({"video": video_path, "segments": face_timeline}, timeline_file, indent=2)
+    return timeline_path
+
+def init_analysis_worker():
+    """
+    Cada proceso del pool usa un solo hilo de OpenCV para no sobresuscribir la CPU
+    """
+    cv2.setNumThreads(1)
+
+def analyze_video_worker(video_path: str) -> Dict:
+    """
+    Analiza un video dentro de un proceso del pool con el analizador de ese proceso
+    """
+    return get_analyzer().analyze_video_auto(video_path)
+
 def analyze_video_auto(video_path: str) -> List[str]:
     """
     Función de conveniencia para obtener argumentos de configuración
     """
-    analyzer = VideoAnalyzer()
+    analyzer = get_analyzer()
     config = analyzer.analyze_video_auto(video_path)
     
     # Convertir configuración a argumentos de línea de comandos
@@ -323,13 +654,14 @@ def analyze_video_auto(video_path: str) -> List[str]:
 if __name__ == "__main__":
     import sys
     
-    analyzer = VideoAnalyzer()
+    analyzer = get_analyzer()
     
     if len(sys.argv) > 1:
         if sys.argv[1] == "analyze":
             # Analizar todos los videos en la carpeta
             folder = sys.argv[2] if len(sys.argv) > 2 else "videos_input"
-            analyzer.analyze_all_videos_in_folder(folder)
+            workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+            analyzer.analyze_all_videos_in_folder(folder, workers)
         else:
             # Analizar video específico
             video_path = sys.argv[1]
@@ -345,3 +677,4 @@ if __name__ == "__main__":
         print("  python video_analyzer.py <video_path>     - Analizar video específico")
         print("  python video_analyzer.py analyze          - Analizar todos los videos en videos_input")
         print("  python video_analyzer.py analyze <folder> - Analizar videos en carpeta específica")
+        print("  python video_analyzer.py analyze <folder> <procesos> - Limitar los procesos en paralelo")